@@ -1,25 +1,25 @@
 import os
-import json
-import ast 
+import sqlite3
+import argparse
+from pathlib import Path
 from typing import Literal
-from functools import lru_cache
 from dotenv import find_dotenv, load_dotenv
 from langchain_core.messages import AIMessage, HumanMessage, ToolMessage, SystemMessage
-from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.sqlite import SqliteSaver
 from langgraph.types import Send, Command
 from langgraph.graph import StateGraph, START, END
 from langchain_core.runnables import RunnableConfig
 from langchain.agents import create_agent
 
 from states import OverallState, TaskListState, Query
-from schema import TaskListSchema, FollowQuestion, Classifier
+from schema import TaskListSchema, FollowQuestion, Classifier, SearchResponse
 from configration import Configration
 from prompt import todo_task, ask_detail_question, brief_answer, question_generator, classifier, draft_writer
-from utils import get_task_topic
-from tools import write_file, write_todo, tavily_search_basic, tavily_search
+from utils import get_task_topic, get_token_manager
+from passages import format_passages, select_passages, source_passages
+from tools import write_file, read_todo, write_todo, update_task, flush_writes, claim_queries, finish_query, search_response, tavily_search_basic, tavily_search, root_dir
 
-from langchain_ollama import ChatOllama
-# from langchain_openai import ChatOpenAI
+from llm import get_llm, start_warm_up
 from writer_agent import run_writer_agent
 
 load_dotenv(find_dotenv())
@@ -27,20 +27,13 @@ load_dotenv(find_dotenv())
 thread_id = "hsi"
 
 
-if os.getenv("OPENROUTER_API_KEY") is None:
+startup_config = Configration.from_runnable_config()
+# The offline setup (local corpus search, Ollama models) needs no API key at all
+if startup_config.search_backend != "local" and os.getenv("OPENROUTER_API_KEY") is None:
     raise ValueError("OPENROUTER Key not Found.")
-
-if os.getenv("TAVILY_API_KEY") is None:
+if startup_config.search_backend == "tavily" and startup_config.replay_mode != "replay" and os.getenv("TAVILY_API_KEY") is None:
     raise ValueError("Tavily Key not Found.")
 
-@lru_cache(maxsize=None)
-def get_llm(model: str = "llama3.2:latest", temperature: float = 0.7) -> ChatOllama:
-    return ChatOllama(
-        model=model,
-        temperature=temperature,
-    )
-
-
 def indepth_reasoning(state: OverallState, config: RunnableConfig):
     """Langgraph node that asks user question to understand about their query
     
@@ -52,24 +45,17 @@ def indepth_reasoning(state: OverallState, config: RunnableConfig):
     """
     
     configurable =  Configration.from_runnable_config(config)
-    llm = get_llm(temperature=0.5)
-    formatted_prompt = f"""
-                        {ask_detail_question}
-                        \n\n
-                        context:
-                        {get_task_topic(state["messages"])}. ask me {configurable.max_question} question
-                        """
-    result = llm.invoke(formatted_prompt)
+    # Clarifying questions are asked once per run; never serve them from the response cache
+    llm = get_llm(temperature=0.5, cache=False)
+    # Static instructions first and alone in the system message, so Ollama can reuse their KV cache
+    formatted_prompt = f"context:\n{get_task_topic(state['messages'])}. ask me {configurable.max_question} question"
+    result = llm.invoke([SystemMessage(content=ask_detail_question), HumanMessage(content=formatted_prompt)])
     # This to ask user questtion to understand their intend
     print(result.content)
     user_input = input(">>")
     state["messages"] += [HumanMessage(content=user_input)]
-    breif_task_prompt = f"""
-                        {brief_answer}
-                        \n\n
-                        {state["messages"]}
-                        """
-    result = llm.invoke(breif_task_prompt)
+    # Message contents only: the reprs carry random message ids that would change the prompt every run
+    result = llm.invoke([SystemMessage(content=brief_answer), HumanMessage(content=get_task_topic(state["messages"]))])
     return {"brief": result.content}
 
 
@@ -87,17 +73,18 @@ def generate_tasklist(state: OverallState, config: RunnableConfig) -> TaskListSt
         TaskListState: Dictionary with state update and tasking for agent planning.
     """
     configurable = Configration.from_runnable_config(config)
+    if configurable.resume:
+        # Resuming a thread: keep its task plan so completed tasks are not researched again
+        existing = read_todo(thread_id)
+        if isinstance(existing, list) and existing:
+            print(f"[generate_tasklist] Resuming with {sum(t['status'] == 'Completed' for t in existing)}/{len(existing)} tasks completed")
+            return {"task_list": existing}
     llm = get_llm(temperature=0.3)
     llm = llm.bind(format="json")
     structured_llm = llm.with_structured_output(TaskListSchema)
-    formatted_prompt = f"""
-                        {todo_task}
-                        \n\n
-                        context:
-                        {state["brief"]}
-                    """
-    
-    result = structured_llm.invoke(formatted_prompt)
+    formatted_prompt = f"context:\n{state['brief']}"
+    
+    result = structured_llm.invoke([SystemMessage(content=todo_task), HumanMessage(content=formatted_prompt)])
     savestate = [r.model_dump() for r in result.tasks]
     write_todo(thread_id, savestate)    
     
@@ -111,8 +98,10 @@ def select_next_task(state: OverallState):
     for task in tasks:
         if task["status"] == "Not Started":  # Not task["status"]
             content = {"task": task["task"], "id": task["id"], "status": "In Progress"}
+            # Claim the task atomically so concurrent branches never pick the same one
+            if not update_task(thread_id, content, expected_status="Not Started"):
+                continue
             task["status"] = "In Progress"
-            write_todo(thread_id, content)
             return {"current_task": task["task"], "current_task_id": task["id"]}
     # All tasks completed
     return {"current_task": None, "current_task_id": None}
@@ -140,47 +129,41 @@ def surface_research(state: OverallState, config: RunnableConfig):
 
     agent = create_agent(llm, tools=[tavily_search_basic])
 
-    surface_research_prompt = f"You are a light research agent whos task is search web for a topic provide by a user. \n\n you will be provided with breif task, which will be the end goal and each task to will take you closer to end goal your task is to foucs on task provided and research web but make sure you research supports the end goal. \n\n"
+    surface_research_prompt = "You are a light research agent whos task is search web for a topic provide by a user. \n\n you will be provided with breif task, which will be the end goal and each task to will take you closer to end goal your task is to foucs on task provided and research web but make sure you research supports the end goal. \n\n"
     
     message = f"Breif Task: {state["brief"]}, Your Task to Resaerch : {state["current_task"]}"
     response = agent.invoke({"messages": [SystemMessage(content=surface_research_prompt), HumanMessage(content=message)]})
     joined_text = ""
     for message in response["messages"]:
         if isinstance(message, ToolMessage) and message.name == "tavily_search_basic":
-            try:
-                # Handle empty content
-                if not message.content or message.content.strip() == "":
-                    print("Skipping empty message content")
-                    continue
-                    
-                content = json.loads(message.content)
-                
-                if "error" in content:
-                    print(f"Skipping error message: {content['error']}")
-                    continue
-                
-                if "results" not in content:
-                    continue
-                
-                for count, result in enumerate(content["results"]):
-                    if "content" in result and result["content"]:
-                        joined_text += result["content"] + "\n\n"
-                        result["id"] = count
-                write_file("sources", thread_id, content["results"])
-            except json.JSONDecodeError as e:
-                print(f"Failed to parse message content as JSON: {e}")
-                print(f"Content was: {message.content[:200]}...")  # Show first 200 chars
+            content = message.artifact
+            if not isinstance(content, SearchResponse):
+                print(f"Skipping tool message without a search result: {str(message.content)[:200]}...")
                 continue
-            except Exception as e:
-                print(f"Unexpected error processing message: {e}")
+            
+            if content.error:
+                print(f"Skipping error message: {content.error}")
                 continue
+            
+            sources = []
+            for count, result in enumerate(content.results):
+                if result.content:
+                    joined_text += result.content + "\n\n"
+                sources.append({
+                    **result.model_dump(exclude_none=True),
+                    "id": count,
+                    "queries": [content.query or state["current_task"]],
+                })
+            write_file("sources", thread_id, sources)
             notes = [{
                 "id": 1,
                 "question": state["current_task"],
-                "note": content.get("answer", "No answer available")
+                "note": content.answer or "No answer available"
             }]
             write_file("notes", thread_id, notes)
 
+    # The checkpoint after this node must not get ahead of the buffered records
+    flush_writes(thread_id=thread_id)
     joined_text = joined_text.strip()
     return {"research": joined_text}
     
@@ -190,18 +173,18 @@ def generate_followup_question(state: OverallState, config: RunnableConfig):
     """Generate follow-up question based on initial research"""
 
     configurable =  Configration.from_runnable_config(config)
-    llm = get_llm(temperature=0.3)
+    # A cached answer would repeat queries that claim_queries then drops as duplicates
+    llm = get_llm(temperature=0.3, cache=False)
     llm = llm.bind(format="json")
-    formatted_prompt = question_generator.format(research_task=state["brief"], search_result=state["research"], number_of_question=configurable.max_follow_up_question)
+    formatted_prompt = f"Research task: {state['brief']}\n\nSearch results: {state['research']}\n\nNumber of questions: {configurable.max_follow_up_question}"
     structured_llm = llm.with_structured_output(FollowQuestion)
     
-    response = structured_llm.invoke(formatted_prompt)
+    response = structured_llm.invoke([SystemMessage(content=question_generator), HumanMessage(content=formatted_prompt)])
     
-    if response:
-        question = [ques.model_dump() for ques in response.question]
-        write_file("question", thread_id, question)
-        
-    return {"query": response.question}
+    # Drop queries already searched for this thread or repeated within the batch
+    kept = claim_queries(thread_id, [ques.model_dump() for ques in response.question], configurable.query_similarity)
+    queries = {question["query"] for question in kept}
+    return {"query": [ques for ques in response.question if ques.query in queries]}
 
     
 
@@ -210,6 +193,9 @@ def parallel_research(state: OverallState, config: RunnableConfig):
     
     configurable = Configration.from_runnable_config(config)
     sends = [Send("deep_research", {"query": q}) for q in state["query"]]
+    if not sends:
+        # Every follow-up query was already searched; classify what surface research found
+        return Command(update={}, goto="classifier_research")
     
     return Command(
         update={},
@@ -218,12 +204,13 @@ def parallel_research(state: OverallState, config: RunnableConfig):
 
 
 def deep_research(state: Query, config: RunnableConfig):
-    """Deep research function researchs deep about the following problem"""
+    """Deep research function researchs deep about the following problem
+
+    In ``direct`` mode (default) the query is sent straight to the search backend; in
+    ``agent`` mode a ReAct agent decides how to search. Both feed the same notes/sources handling.
+    """
     
     configurable = Configration.from_runnable_config(config)
-    llm = get_llm(temperature=0)
-    agent = create_agent(llm, tools=[tavily_search])
-    
     
     query_obj = state["query"]
     if hasattr(query_obj, 'query'):
@@ -234,57 +221,83 @@ def deep_research(state: Query, config: RunnableConfig):
     else:
         query_text = str(query_obj)
     
-    
-    response  = agent.invoke({"messages": HumanMessage(content=query_text)})
-    sources = []
-    notes = []
-    
-    for count, resp in enumerate(reversed(response["messages"])):
-        if isinstance(resp, ToolMessage):
-            try:
-                # First try JSON parsing
-                content = json.loads(resp.content)
-            except json.JSONDecodeError:
-                try:
-                    # Then try literal eval
-                    content = ast.literal_eval(resp.content)
-                except (ValueError, SyntaxError):
-                    # If both fail, skip this message or handle as plain text
-                    print(f"Could not parse tool message content: {resp.content[:100]}...")
-                    continue
-            
-            if isinstance(content, str):
-                # If content is just a string, skip it
-                print(f"Skipping string content: {content[:100]}...")
-                continue
-            
-            if not isinstance(content, dict):
-                print(f"Content is not a dictionary: {type(content)}")
-                continue
-            
-            if "error" in content:
-                print(f"Search tool returned error: {content['error']}")
-                continue
-            
-            if "query" not in content or "results" not in content:
-                print(f"Invalid content structure: {content.keys()}")
-                continue
-            
-            note_data = {
-                "id": count,
-                "question": content.get("query", "Unknown"),
-                "note": content.get("answer", "No answer available")
-            }
-            
-            for count, source in enumerate(content.get("results", [])):
-                source["id"] = count
-                sources.append(source)
-            notes.append(note_data)     
+    responses = []
+    try:
+        if configurable.deep_research_mode == "direct":
+            # The agent would only call the search tool with this query and discard its final answer
+            responses = [search_response(query_text, "advanced")]
+        else:
+            responses = agent_search_responses(query_text)
+    finally:
+        # Record the query as searched only if a search succeeded, so a failed one can be retried
+        finish_query(thread_id, query_text, any(not response.error for response in responses))
+    
+    sources, notes = research_records(responses)
     write_file("notes", thread_id, notes)
     write_file("sources", thread_id, sources)
+    flush_writes(thread_id=thread_id)
     
     return {"search_response": sources, "search_notes": notes}
+
+
+def agent_search_responses(query_text: str) -> list[SearchResponse]:
+    """Let a ReAct agent research the query and return the search responses of its tool calls, newest first"""
+    llm = get_llm(temperature=0)
+    agent = create_agent(llm, tools=[tavily_search])
+    
+    response  = agent.invoke({"messages": HumanMessage(content=query_text)})
+    return [
+        message.artifact for message in reversed(response["messages"])
+        if isinstance(message, ToolMessage) and isinstance(message.artifact, SearchResponse)
+    ]
+
+
+def research_records(responses: list[SearchResponse]) -> tuple[list[dict], list[dict]]:
+    """Turn search responses into the source and note records of ``deep_research``
+
+    Args:
+        responses (list[SearchResponse]): Typed search responses
+
+    Returns:
+        tuple[list[dict], list[dict]]: Sources tagged with the query that found them, and one note per response
+    """
+    sources = []
+    notes = []
+    for count, content in enumerate(responses):
+        if content.error:
+            print(f"Search tool returned error: {content.error}")
+            continue
+        
+        note_data = {
+            "id": count,
+            "question": content.query or "Unknown",
+            "note": content.answer or "No answer available"
+        }
+        
+        for count, result in enumerate(content.results):
+            sources.append({**result.model_dump(exclude_none=True), "id": count, "queries": [content.query]})
+        notes.append(note_data)
+    return sources, notes
     
+def research_context(sources: list[dict], query: str, config: RunnableConfig) -> str:
+    """Source passages most relevant to ``query``, kept under ``context_token_budget`` tokens
+
+    Args:
+        sources (list[dict]): Search results with ``content``, ``title`` and ``url``
+        query (str): Section label or task the passages are ranked against
+        config (RunnableConfig): Configration with the budget and passage size
+
+    Returns:
+        str: Selected passages formatted for a prompt
+    """
+    configurable = Configration.from_runnable_config(config)
+    counter = get_token_manager(configurable.query_generation_model).count_string_tokens
+    passages = select_passages(
+        source_passages(sources, configurable.passage_words), query, configurable.context_token_budget, counter
+    )
+    return format_passages(passages)
+
+
 def classifier_research(state: OverallState, config: RunnableConfig):
     """Classifer to determine research heading"""
     
@@ -294,8 +307,7 @@ def classifier_research(state: OverallState, config: RunnableConfig):
         content += (note.get("note") or "") + "\n"
         
     content += "\n Sources: \n"
-    for source in state["search_response"]:
-        content += (source.get("content") or "") + "\n\n"
+    content += research_context(state["search_response"], f"{state.get('current_task') or ''} {state.get('brief') or ''}", config)
     
     llm = get_llm(temperature=0.3)
     llm = llm.bind(format="json")
@@ -327,7 +339,8 @@ def generate_draft(state: OverallState, config: RunnableConfig):
     
     configrurable = Configration.from_runnable_config(config)
     llm = get_llm(temperature=1.0)
-    formatted_prompt = f"\n\nSection: \n\n {state["classifier"]} \n\n Researching about : {state["brief"]} \n\n Research data : {state["search_response"]}"
+    research_data = research_context(state["search_response"], f"{state['classifier']} {state['brief']}", config)
+    formatted_prompt = f"\n\nSection: \n\n {state['classifier']} \n\n Researching about : {state['brief']} \n\n Research data : \n\n{research_data}"
     # formatted_prompt = draft_writer.format(section_name=state["classifier"], target_audience="Academic Researcher", tone="Professional", research_data=state["search_response"], brief_question=state["brief"])
     response = llm.invoke([SystemMessage(content=draft_writer), HumanMessage(content=formatted_prompt)])
     
@@ -336,8 +349,9 @@ def generate_draft(state: OverallState, config: RunnableConfig):
     
     current_task_id = state.get("current_task_id")
     if current_task_id is not None:
-        write_todo(thread_id, {"task": state.get("current_task", ""), "id": current_task_id, "status": "Completed"})
+        update_task(thread_id, {"id": current_task_id, "status": "Completed"})
     write_file("draft", thread_id, [resp])
+    flush_writes("draft", thread_id)
     
     return {"search_response": [], "search_notes": [], "draft": [resp]}
     
@@ -358,7 +372,9 @@ def reroute_task_selection(state: OverallState, config: RunnableConfig):
 
 def write_report_node(state: OverallState, config: RunnableConfig):
     """Run the writer agent to produce the final formatted report."""
-    report = run_writer_agent(tid=thread_id)
+    flush_writes()
+    # Hand the run's settings on, so per-run values given in the config reach the writer nodes too
+    report = run_writer_agent(tid=thread_id, config={"configurable": Configration.from_runnable_config(config).model_dump()})
     print(f"[write_report_node] Final report generated ({len(report)} chars)")
     return {"messages": [AIMessage(content=report)]}
     
@@ -367,6 +383,9 @@ def write_report_node(state: OverallState, config: RunnableConfig):
 def summarize_conversation_node(state: OverallState, config: RunnableConfig):
     """Mark current task as completed in state, then summarize conversation."""
     
+    # Task boundary: persist everything the research and draft nodes buffered
+    flush_writes(thread_id=thread_id)
+    
     # ── Update task_list to mark current task completed ──
     current_task_id = state.get("current_task_id")
     tasks = state.get("task_list", [])
@@ -439,8 +458,6 @@ def summarize_conversation_node(state: OverallState, config: RunnableConfig):
 
 
 
-checkpointer = MemorySaver()
-config = {"configurable": {"thread_id": thread_id}, "recursion_limit": 150}
 builder = StateGraph(OverallState, context_schema=Configration)
 
 
@@ -479,12 +496,64 @@ builder.add_conditional_edges(
 
 graph = builder.compile(name="pro-search-agent")
 
-user_input = input("Enter research question >> ")
-thread_id = input("Enter unique thread id >> ")
 
-for chunk in graph.stream(
-    {"messages": [HumanMessage(content=user_input)]}, 
-    stream_mode="updates",
-    config=config
-):
-    print(chunk)
\ No newline at end of file
+def open_checkpointer() -> SqliteSaver:
+    """Durable SQLite checkpointer, so an interrupted run can continue from its last completed node"""
+    configurable = Configration.from_runnable_config()
+    db_path = Path(configurable.checkpoint_db or Path(root_dir).joinpath("checkpoints.db"))
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    return SqliteSaver(sqlite3.connect(db_path, check_same_thread=False))
+
+
+def reset_interrupted_tasks(tid: str) -> None:
+    """Put tasks left "In Progress" by a crashed run back to "Not Started" so they are picked up again"""
+    todos = read_todo(tid)
+    if isinstance(todos, list):
+        for todo in todos:
+            if todo["status"] == "In Progress":
+                update_task(tid, {"id": todo["id"], "status": "Not Started"}, expected_status="In Progress")
+
+
+def run(tid: str, user_input: str | None = None, resume: bool = False):
+    """Run the research graph for a thread with a durable checkpointer
+
+    Args:
+        tid (str): Thread id, used for the checkpoint and the research folders
+        user_input (str | None): Research question, needed unless resuming from a checkpoint
+        resume (bool): Continue the thread from its last completed node and skip tasks
+            already marked Completed in the todo store
+    """
+    global thread_id
+    thread_id = tid
+    durable_graph = builder.compile(checkpointer=open_checkpointer(), name="pro-search-agent")
+    config = {"configurable": {"thread_id": tid, "resume": resume}, "recursion_limit": 150}
+
+    inputs = {"messages": [HumanMessage(content=user_input)]} if user_input else None
+    if resume:
+        reset_interrupted_tasks(tid)
+        snapshot = durable_graph.get_state(config)
+        if snapshot.next:
+            print(f"[resume] Continuing thread '{tid}' at {', '.join(snapshot.next)}")
+            inputs = None
+        elif snapshot.values:
+            print(f"[resume] Thread '{tid}' already finished")
+            return
+        elif inputs is None:
+            inputs = {"messages": [HumanMessage(content=input("Enter research question >> "))]}
+
+    for chunk in durable_graph.stream(inputs, stream_mode="updates", config=config):
+        print(chunk)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deep research agent")
+    parser.add_argument("--resume", metavar="THREAD_ID", help="Continue an interrupted thread from its last checkpoint")
+    args = parser.parse_args()
+    # Load the model while the user types; the first node call then skips the cold start
+    start_warm_up()
+
+    if args.resume:
+        run(args.resume, resume=True)
+    else:
+        user_input = input("Enter research question >> ")
+        run(input("Enter unique thread id >> "), user_input=user_input)
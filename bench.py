@@ -0,0 +1,125 @@
+"""End-to-end benchmarks of the research graph and the writer agent.
+
+Record the LLM and search calls of one real run, then replay them so repeated runs
+measure only the pipeline's own overhead (optionally with the recorded latencies):
+
+    REPLAY_MODE=record python bench.py agent --question "..." --answer "..."
+    REPLAY_MODE=replay python bench.py agent --question "..." --answer "..." --repeat 5
+    REPLAY_MODE=replay python bench.py writer --thread-id <id> --repeat 5
+
+Against a live Ollama the time to first token of every LLM call is reported per node;
+pass --cold to skip the model warm-up and measure the cold start.
+"""
+import time
+import argparse
+import statistics
+from uuid import uuid4
+
+from langchain_core.messages import HumanMessage
+
+import agent
+from configration import Configration
+from llm import LLM_TIMINGS, llm_cache_stats, warm_up
+from replay import replay_store
+from tools import copy_thread, flush_writes, search_cache_stats
+from writer_agent import run_writer_agent
+
+
+def bench_agent(question: str, answer: str, thread_prefix: str) -> dict:
+    """Stream the research graph once on a fresh thread
+
+    Args:
+        question (str): Research question
+        answer (str): Reply given to the clarifying questions of ``indepth_reasoning``
+        thread_prefix (str): Prefix of the generated thread id
+
+    Returns:
+        dict: Wall time of the run and the time spent until each node's update arrived
+    """
+    tid = f"{thread_prefix}-{uuid4().hex[:8]}"
+    agent.thread_id = tid
+    # indepth_reasoning asks the user for details; answer with the scripted reply
+    agent.input = lambda prompt="": answer
+    node_seconds: dict[str, float] = {}
+    start = last = time.perf_counter()
+    config = {"configurable": {"thread_id": tid}, "recursion_limit": 150}
+    for chunk in agent.graph.stream({"messages": [HumanMessage(content=question)]}, stream_mode="updates", config=config):
+        now = time.perf_counter()
+        for node in chunk:
+            node_seconds[node] = node_seconds.get(node, 0.0) + now - last
+        last = now
+    flush_writes()
+    return {"thread_id": tid, "seconds": time.perf_counter() - start, "nodes": node_seconds}
+
+
+def bench_writer(thread_id: str) -> dict:
+    """Run the writer agent once on a fresh copy of an existing thread's research
+
+    Every run reads the same inputs: whatever a run writes (indexes, the report) lands
+    in its own copy, named ``<thread_id>-<hex>``.
+    """
+    tid = f"{thread_id}-{uuid4().hex[:8]}"
+    copy_thread(thread_id, tid)
+    start = time.perf_counter()
+    report = run_writer_agent(tid=tid)
+    return {"thread_id": tid, "seconds": time.perf_counter() - start, "report_chars": len(report)}
+
+
+def summarize(runs: list[dict]) -> dict:
+    """Min/median/mean/max wall time over the runs"""
+    seconds = [run["seconds"] for run in runs]
+    return {
+        "runs": len(seconds),
+        "min": min(seconds),
+        "median": statistics.median(seconds),
+        "mean": statistics.fmean(seconds),
+        "max": max(seconds),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the research pipeline")
+    parser.add_argument("target", choices=["agent", "writer"])
+    parser.add_argument("--question", help="Research question (agent)")
+    parser.add_argument("--answer", default="No further details.", help="Reply to the clarifying questions (agent)")
+    parser.add_argument("--thread-id", default="bench", help="Thread to write the report for (writer) or thread id prefix (agent)")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--cold", action="store_true", help="Skip the model warm-up before the first run")
+    args = parser.parse_args()
+    if args.target == "agent" and not args.question:
+        parser.error("--question is required for the agent benchmark")
+
+    configurable = Configration.from_runnable_config()
+    print(f"[bench] target={args.target} replay_mode={configurable.replay_mode} latency_scale={configurable.replay_latency_scale}")
+    if not args.cold:
+        warm_up()
+    runs = []
+    store = replay_store()
+    for count in range(args.repeat):
+        if store is not None:
+            # Every run replays the recording from its first call
+            store.new_run()
+        if args.target == "agent":
+            result = bench_agent(args.question, args.answer, args.thread_id)
+        else:
+            result = bench_writer(args.thread_id)
+        runs.append(result)
+        print(f"[bench] run {count + 1}/{args.repeat}: {result['seconds']:.3f}s")
+        for node, seconds in sorted(result.get("nodes", {}).items(), key=lambda item: item[1], reverse=True):
+            print(f"    {node:<30} {seconds:.3f}s")
+
+    stats = summarize(runs)
+    print(
+        f"[bench] {stats['runs']} runs: min {stats['min']:.3f}s  median {stats['median']:.3f}s  "
+        f"mean {stats['mean']:.3f}s  max {stats['max']:.3f}s"
+    )
+    print(f"[bench] search cache: {search_cache_stats()}")
+    print(f"[bench] LLM cache: {llm_cache_stats()}")
+    ttft = LLM_TIMINGS.summary()
+    if ttft:
+        print("[bench] time to first token per node (first / mean / max, mean evaluated prompt tokens):")
+        for node, timing in sorted(ttft.items(), key=lambda item: item[1]["mean_ttft"], reverse=True):
+            print(
+                f"    {node:<30} {timing['calls']:>3} calls  {timing['first_ttft']:.3f}s / "
+                f"{timing['mean_ttft']:.3f}s / {timing['max_ttft']:.3f}s  {timing['mean_prompt_tokens']:.0f} tokens"
+            )
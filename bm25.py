@@ -0,0 +1,126 @@
+import re
+import json
+import math
+import threading
+from collections import Counter
+from pathlib import Path
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+_lock = threading.RLock()
+_indexes: dict[Path, "BM25Index"] = {}
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase, split on non-alphanumerics and drop stopwords"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Incremental inverted index with Okapi BM25 ranking.
+
+    Documents are only ever added. On disk the index is an append-only JSONL file
+    holding one entry (term frequencies, length and metadata) per document, so
+    persisting a new document never rewrites the existing ones.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs: list[dict] = []
+        self.doc_len: list[int] = []
+        self.postings: dict[str, dict[int, int]] = {}
+        self.total_len = 0
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def _add_entry(self, entry: dict) -> None:
+        doc_idx = len(self.docs)
+        self.docs.append(entry["meta"])
+        self.doc_len.append(entry["len"])
+        self.total_len += entry["len"]
+        for term, tf in entry["tf"].items():
+            self.postings.setdefault(term, {})[doc_idx] = tf
+
+    def add(self, text: str, meta: dict) -> dict:
+        """Index a document
+
+        Args:
+            text (str): Text to index
+            meta (dict): Returned as-is when the document matches a query
+
+        Returns:
+            dict: The entry that was indexed, in its on-disk form
+        """
+        tokens = tokenize(text)
+        entry = {"meta": meta, "len": len(tokens), "tf": dict(Counter(tokens))}
+        self._add_entry(entry)
+        return entry
+
+    def search(self, query: str, top_k: int = 5) -> list[tuple[float, dict]]:
+        """Rank indexed documents against a query
+
+        Args:
+            query (str): Free-text query
+            top_k (int): Number of results to return
+
+        Returns:
+            list[tuple[float, dict]]: (score, meta) pairs, best first
+        """
+        if not self.docs:
+            return []
+        n_docs = len(self.docs)
+        avg_len = self.total_len / n_docs or 1
+        scores: dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_idx, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[doc_idx] / avg_len)
+                scores[doc_idx] = scores.get(doc_idx, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(score, self.docs[doc_idx]) for doc_idx, score in ranked]
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        """Rebuild an index from its JSONL file, empty if the file does not exist"""
+        index = cls()
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as file:
+                for line in file:
+                    if line.strip():
+                        index._add_entry(json.loads(line))
+        return index
+
+
+def open_index(path: Path) -> BM25Index:
+    """Load an index once per process and keep it in memory"""
+    with _lock:
+        if path not in _indexes:
+            _indexes[path] = BM25Index.load(path)
+        return _indexes[path]
+
+
+def add_documents(path: Path, documents: list[tuple[str, dict]]) -> BM25Index:
+    """Index ``(text, meta)`` documents and append them to the persisted index
+
+    Args:
+        path (Path): JSONL file backing the index
+        documents (list[tuple[str, dict]]): Documents to add
+
+    Returns:
+        BM25Index: The updated in-memory index
+    """
+    with _lock:
+        index = open_index(path)
+        entries = [index.add(text, meta) for text, meta in documents]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as file:
+            file.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+        return index
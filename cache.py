@@ -0,0 +1,112 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any
+
+from configration import Configration
+
+
+_summary_cache: "DiskCache | None" = None
+_summary_cache_lock = threading.Lock()
+
+
+def make_key(*parts: Any) -> str:
+    """Stable SHA-256 key for any JSON-serializable parts"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """Persistent string cache in a single SQLite file.
+
+    Entries expire ``ttl`` seconds after they were stored (never if ``ttl`` is None) and
+    the least recently used ones are evicted once more than ``max_entries`` are held.
+    Hits and misses are counted for the lifetime of the object.
+    """
+
+    def __init__(self, path: str | Path, ttl: float | None = None, max_entries: int = 10_000):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        self._conn.commit()
+        (self._entries,) = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+
+    def get(self, key: str) -> str | None:
+        """Cached value for ``key``, or None on a miss or an expired entry"""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._entries -= 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        """Store ``value`` under ``key``, evicting least recently used entries past ``max_entries``"""
+        now = time.time()
+        with self._lock, self._conn:
+            replaced = self._conn.execute("SELECT 1 FROM cache WHERE key = ?", (key,)).fetchone() is not None
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._entries += 0 if replaced else 1
+            excess = self._entries - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)", (excess,)
+                )
+                self._entries -= excess
+
+    def clear(self) -> None:
+        """Drop every entry"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache")
+            self._entries = 0
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": self._entries,
+            }
+
+
+def summary_cache() -> DiskCache | None:
+    """Shared cache of chunk summaries keyed by chunk hash, or None while recording or replaying"""
+    global _summary_cache
+    configurable = Configration.from_runnable_config()
+    if configurable.replay_mode != "off":
+        return None
+    with _summary_cache_lock:
+        if _summary_cache is None:
+            _summary_cache = DiskCache(configurable.research_root().joinpath("summary_cache.db"))
+    return _summary_cache
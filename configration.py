@@ -1,18 +1,24 @@
 import os
+from pathlib import Path
 
 from pydantic import BaseModel, Field
-from typing import Any, Optional
+from typing import Any, Literal, Optional
 
 from langchain_core.runnables import RunnableConfig
 
 class Configration(BaseModel):
     """
     The configration for the agent.
+
+    Every field can be set through the environment variable of the same name in upper
+    case, which takes precedence over the run config. Settings of the components shared
+    by the whole process (storage, caches, search backend and client, models) are read
+    without a run config, so only their environment variable applies; README.md lists them.
     """
     
     query_generation_model: str = Field(
         default="llama3.2:latest",
-        description="Name of the model for to use for query generation"
+        description="Name of the Ollama chat model used by the research and writer agents"
     )
     
     query_count: int = Field(
@@ -35,6 +41,212 @@ class Configration(BaseModel):
         description="Maximum number of follow up question asked by user."
     )
     
+    deep_research_mode: Literal["direct", "agent"] = Field(
+        default="direct",
+        description="direct sends each follow-up query straight to the search backend; agent lets a ReAct agent run the search"
+    )
+    
+    context_token_budget: int = Field(
+        default=3000,
+        description="Tokens of ranked source passages put into classifier and draft prompts"
+    )
+    
+    passage_words: int = Field(
+        default=120,
+        gt=20,
+        description="Words per passage when sources are chunked for ranking; must exceed the 20-word passage overlap"
+    )
+    
+    embedding_backend: Literal["hashing", "ollama"] = Field(
+        default="hashing",
+        description="Embeddings of the source passage index: a dependency-free hashing vectorizer or an Ollama embedding model"
+    )
+    
+    embedding_model: str = Field(
+        default="nomic-embed-text",
+        description="Ollama model used when embedding_backend is ollama"
+    )
+    
+    section_passages: int = Field(
+        default=8,
+        description="Source passages retrieved for each report section by its heading and brief"
+    )
+    
+    llm_concurrency: int = Field(
+        default=4,
+        description="Maximum LLM requests the async writer pipeline keeps in flight against the inference server"
+    )
+    
+    search_concurrency: int = Field(
+        default=4,
+        description="Maximum number of web searches running at the same time"
+    )
+    
+    search_timeout: float = Field(
+        default=30.0,
+        description="Seconds allowed for a single web search, retries and backoff included, when several run concurrently"
+    )
+    
+    search_request_timeout: float = Field(
+        default=10.0,
+        description="Seconds allowed per HTTP request to the search API; a timed out request is retried"
+    )
+    
+    search_rate_limit: float = Field(
+        default=1.5,
+        description="Sustained Tavily requests per second allowed by the plan"
+    )
+    
+    search_burst: int = Field(
+        default=5,
+        description="Tavily requests that may be sent back to back before the rate limit applies"
+    )
+    
+    search_max_retries: int = Field(
+        default=4,
+        description="Retries of a search on HTTP 429/5xx or connection errors, with jittered exponential backoff"
+    )
+    
+    search_pool_size: int = Field(
+        default=10,
+        description="Kept-alive HTTP connections to the search API"
+    )
+    
+    search_breaker_threshold: int = Field(
+        default=5,
+        description="Consecutive search failures that open the circuit breaker"
+    )
+    
+    search_breaker_reset: float = Field(
+        default=30.0,
+        description="Seconds the circuit breaker stays open before a trial search is let through"
+    )
+    
+    search_cache: bool = Field(
+        default=True,
+        description="Cache web search results on disk. Set to False to bypass the cache"
+    )
+    
+    search_cache_ttl: Optional[float] = Field(
+        default=7 * 24 * 3600,
+        description="Seconds a cached search result stays valid. None keeps results until evicted"
+    )
+    
+    search_cache_size: int = Field(
+        default=10_000,
+        description="Maximum cached search results; least recently used ones are evicted first"
+    )
+    
+    llm_keep_alive: str = Field(
+        default="30m",
+        description="How long Ollama keeps a model loaded after its last call, e.g. 30m or 2h; a negative duration keeps it loaded"
+    )
+    
+    llm_warmup: bool = Field(
+        default=True,
+        description="Load the chat model into Ollama at startup so the first node call does not pay the model load"
+    )
+    
+    llm_cache: bool = Field(
+        default=True,
+        description="Cache LLM responses on disk, keyed on model, temperature, messages and output schema. Nodes can opt out"
+    )
+    
+    llm_cache_size: int = Field(
+        default=5_000,
+        description="Maximum cached LLM responses; least recently used ones are evicted first"
+    )
+    
+    query_similarity: float = Field(
+        default=0.7,
+        description="Token-set similarity at which a follow-up query counts as a duplicate of one already generated or searched"
+    )
+    
+    search_backend: Literal["tavily", "local"] = Field(
+        default="tavily",
+        description="Search backend behind the search tools: the Tavily API or an offline BM25 search over search_corpus_dir"
+    )
+    
+    search_corpus_dir: Optional[str] = Field(
+        default=None,
+        description="Folder of .txt/.md/.json/.jsonl documents searched by the local backend"
+    )
+    
+    replay_mode: Literal["off", "record", "replay"] = Field(
+        default="off",
+        description="record stores every LLM and search response in the replay store; replay serves them back for deterministic benchmarks"
+    )
+    
+    replay_path: Optional[str] = Field(
+        default=None,
+        description="SQLite file holding recorded responses. Defaults to research/replay.db"
+    )
+    
+    replay_latency_scale: float = Field(
+        default=0.0,
+        description="Fraction of each recorded latency to sleep when replaying (0 = instant, 1 = real time)"
+    )
+    
+    research_dir: Optional[str] = Field(
+        default=None,
+        description="Folder holding the research data of every thread. Defaults to research/ next to the code"
+    )
+    
+    log_segment_bytes: int = Field(
+        default=64 * 1024 * 1024,
+        description="Size after which a research folder starts a new JSONL log file"
+    )
+    
+    checkpoint_db: Optional[str] = Field(
+        default=None,
+        description="SQLite file for graph checkpoints. Defaults to checkpoints.db inside the research folder"
+    )
+    
+    resume: bool = Field(
+        default=False,
+        description="Resume the thread: reuse its stored task plan instead of generating a new one"
+    )
+    
+    storage_compression: Literal["none", "gzip", "zstd"] = Field(
+        default="none",
+        description="Compression of new JSONL logs; each appended batch is its own gzip/zstd frame"
+    )
+    
+    storage_backend: Literal["file", "sqlite"] = Field(
+        default="file",
+        description="Where research records are stored: JSONL files per folder or a single SQLite database"
+    )
+    
+    sqlite_path: Optional[str] = Field(
+        default=None,
+        description="Path of the SQLite research database. Defaults to research.db inside the research folder"
+    )
+    
+    write_buffer_size: int = Field(
+        default=64,
+        description="Buffered research records that trigger a background flush. 0 writes synchronously"
+    )
+    
+    write_buffer_interval: float = Field(
+        default=2.0,
+        description="Seconds after which buffered research records are flushed even if the buffer is not full"
+    )
+    
+    summary_min_tokens: int = Field(
+        default=1000,
+        description="Sources, notes or drafts shorter than this many tokens are passed to the writer unsummarized"
+    )
+    
+    summary_chunk_tokens: int = Field(
+        default=3000,
+        description="Token size of the chunks the writer summarizes in parallel before reducing them into one summary"
+    )
+    
+    max_source_records: Optional[int] = Field(
+        default=None,
+        description="Cap on how many stored sources the writer loads for summarization. None loads all"
+    )
+    
     
     
     @classmethod
@@ -52,4 +264,8 @@ class Configration(BaseModel):
 
         values = {k: v for k, v in raw_values.items() if v is not None}
         
-        return cls(**values)
\ No newline at end of file
+        return cls(**values)
+
+    def research_root(self) -> Path:
+        """Folder holding the research data: ``research_dir``, or research/ next to the code"""
+        return Path(self.research_dir) if self.research_dir else Path(__file__).resolve().parent.joinpath("research")
\ No newline at end of file
@@ -0,0 +1,245 @@
+import re
+import json
+import hashlib
+import threading
+from pathlib import Path
+from typing import Callable, Iterable
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from bm25 import tokenize
+
+# Max differing SimHash bits for two texts to count as near-duplicates
+SIMHASH_DISTANCE = 3
+# Fewer shingles than this leave too little signal: every short text would look alike
+SIMHASH_MIN_SHINGLES = 5
+# Words of any script; runs of CJK characters (written without spaces) are split per character
+WORD_PATTERN = re.compile(r"[^\W_]+")
+CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+# Token-set Jaccard similarity at which two search queries count as the same query
+QUERY_SIMILARITY = 0.7
+# Query parameters dropped from URLs: exact keys, plus any key starting with a prefix
+TRACKING_PARAMS = frozenset({"fbclid", "gclid", "mc_cid", "mc_eid", "ref", "ref_src"})
+TRACKING_PREFIXES = ("utm_",)
+
+_lock = threading.RLock()
+_dedupers: dict[Path, "SourceDeduper"] = {}
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a URL: lowercase host without www, no fragment, tracking params or trailing slash"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower().removeprefix("www.")
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    ))
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(("https" if parts.scheme in ("http", "https") else parts.scheme, host, path, query, ""))
+
+
+def content_fingerprint(text: str) -> str:
+    """SHA-1 of the text with case and whitespace normalized"""
+    normalized = re.sub(r"\s+", " ", text.lower()).strip()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def shingle_tokens(text: str) -> list[str]:
+    """Lowercase word tokens of any script, with CJK text split into single characters"""
+    tokens = []
+    for word in WORD_PATTERN.findall(text.lower()):
+        if CJK_PATTERN.search(word):
+            tokens += [part for part in re.split(f"({CJK_PATTERN.pattern})", word) if part]
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def simhash(text: str, bits: int = 64) -> int | None:
+    """SimHash over word 3-shingles, close in Hamming distance for near-identical texts
+
+    Returns None when the text has fewer than ``SIMHASH_MIN_SHINGLES`` shingles, so short
+    texts are compared by URL and exact content only.
+    """
+    tokens = shingle_tokens(text)
+    shingles = [" ".join(tokens[i:i + 3]) for i in range(len(tokens) - 2)]
+    if len(shingles) < SIMHASH_MIN_SHINGLES:
+        return None
+    weights = [0] * bits
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=bits // 8).digest(), "big")
+        for bit in range(bits):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(bits) if weights[bit] > 0)
+
+
+def query_terms(query: str) -> frozenset[str]:
+    """Order-insensitive terms of a search query, with plural endings folded"""
+    terms = set()
+    for token in tokenize(query):
+        if len(token) > 4 and token.endswith("ies"):
+            token = token[:-3] + "y"
+        elif len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        terms.add(token)
+    return frozenset(terms)
+
+
+def dedupe_queries(
+    queries: list[str], history: Iterable[str] = (), threshold: float = QUERY_SIMILARITY
+) -> list[int]:
+    """Pick the queries worth running
+
+    A query is dropped when its term set is at least ``threshold`` similar to an earlier
+    query of the batch or to one already executed.
+
+    Args:
+        queries (list[str]): Candidate queries, in priority order
+        history (Iterable[str]): Queries already executed
+        threshold (float): Jaccard similarity that marks a near-duplicate
+
+    Returns:
+        list[int]: Positions in ``queries`` of the queries to keep
+    """
+    seen = [query_terms(query) for query in history]
+    kept = []
+    for position, query in enumerate(queries):
+        terms = query_terms(query)
+        if not terms:
+            continue
+        if any(len(terms & other) / len(terms | other) >= threshold for other in seen if other):
+            continue
+        seen.append(terms)
+        kept.append(position)
+    return kept
+
+
+class SourceDeduper:
+    """Tracks which sources of a thread were already stored.
+
+    A source is a duplicate when its normalized URL, its content SHA-1 or (for
+    near-duplicates) its SimHash matches a stored one. The keys of stored sources and
+    the extra queries that found a duplicate are kept in an append-only sidecar file,
+    so the state is rebuilt without reading the sources themselves.
+    """
+
+    BANDS = 4
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.by_url: dict[str, int] = {}
+        self.by_hash: dict[str, int] = {}
+        self.by_band: dict[tuple[int, int], list[tuple[int, int]]] = {}
+        self.extra_queries: dict[int, list[str]] = {}
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as file:
+                for line in file:
+                    if line.strip():
+                        self._apply(json.loads(line))
+
+    def _apply(self, entry: dict) -> None:
+        if "query" in entry:
+            self.extra_queries.setdefault(entry["id"], []).append(entry["query"])
+            return
+        if entry.get("url"):
+            self.by_url.setdefault(entry["url"], entry["id"])
+        if entry.get("sha1"):
+            self.by_hash.setdefault(entry["sha1"], entry["id"])
+        if entry.get("simhash") is not None:
+            for band in self._bands(entry["simhash"]):
+                self.by_band.setdefault(band, []).append((entry["simhash"], entry["id"]))
+
+    def _bands(self, value: int) -> list[tuple[int, int]]:
+        width = 64 // self.BANDS
+        return [(band, value >> (band * width) & ((1 << width) - 1)) for band in range(self.BANDS)]
+
+    def _keys(self, record: dict) -> dict:
+        text = record.get("content") or ""
+        return {
+            "url": normalize_url(record["url"]) if record.get("url") else None,
+            "sha1": content_fingerprint(text) if text else None,
+            "simhash": simhash(text),
+        }
+
+    def _find(self, keys: dict) -> int | None:
+        if keys["url"] in self.by_url:
+            return self.by_url[keys["url"]]
+        if keys["sha1"] in self.by_hash:
+            return self.by_hash[keys["sha1"]]
+        if keys["simhash"] is not None:
+            for band in self._bands(keys["simhash"]):
+                for other, source_id in self.by_band.get(band, []):
+                    if bin(other ^ keys["simhash"]).count("1") <= SIMHASH_DISTANCE:
+                        return source_id
+        return None
+
+    def ingest(self, records: list[dict], store: Callable[[list[dict]], object]) -> list[dict]:
+        """Store only new sources and fold duplicates into the source already kept
+
+        Args:
+            records (list[dict]): Incoming sources, optionally with a ``queries`` list
+            store (Callable): Persists a list of records, assigning their ``id``
+
+        Returns:
+            list[dict]: The records that were actually stored
+        """
+        with _lock:
+            kept: list[tuple[dict, dict]] = []
+            merges: list[dict] = []
+            for record in records:
+                keys = self._keys(record)
+                source_id = self._find(keys)
+                if source_id is not None:
+                    merges += [
+                        {"id": source_id, "query": query} for query in record.get("queries", [])
+                        if query not in self.extra_queries.get(source_id, [])
+                    ]
+                    continue
+                twin = next((kept_record for kept_record, kept_keys in kept if self._same(keys, kept_keys)), None)
+                if twin is not None:
+                    twin["queries"] = twin.get("queries", []) + [
+                        query for query in record.get("queries", []) if query not in twin.get("queries", [])
+                    ]
+                    continue
+                kept.append((record, keys))
+            if kept:
+                store([record for record, _ in kept])
+            self._append([{"id": record["id"], **keys} for record, keys in kept] + merges)
+            return [record for record, _ in kept]
+
+    def seed(self, records: list[dict]) -> None:
+        """Register sources stored before deduplication was enabled"""
+        with _lock:
+            self._append([{"id": record.get("id"), **self._keys(record)} for record in records])
+
+    def _append(self, entries: list[dict]) -> None:
+        for entry in entries:
+            self._apply(entry)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write("".join(json.dumps(entry) + "\n" for entry in entries))
+
+    @staticmethod
+    def _same(keys: dict, other: dict) -> bool:
+        if keys["url"] and keys["url"] == other["url"]:
+            return True
+        if keys["sha1"] and keys["sha1"] == other["sha1"]:
+            return True
+        return (
+            keys["simhash"] is not None and other["simhash"] is not None
+            and bin(keys["simhash"] ^ other["simhash"]).count("1") <= SIMHASH_DISTANCE
+        )
+
+    def with_queries(self, record: dict) -> dict:
+        """Attach the queries of collapsed duplicates to a stored source"""
+        extra = self.extra_queries.get(record.get("id"))
+        if extra:
+            record["queries"] = record.get("queries", []) + [query for query in extra if query not in record.get("queries", [])]
+        return record
+
+
+def open_deduper(path: Path) -> SourceDeduper:
+    """Load a thread's deduplication state once per process"""
+    with _lock:
+        if path not in _dedupers:
+            _dedupers[path] = SourceDeduper(path)
+        return _dedupers[path]
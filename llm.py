@@ -0,0 +1,257 @@
+import json
+import time
+import asyncio
+import threading
+import weakref
+from functools import lru_cache
+from typing import Any, Sequence
+from uuid import UUID
+
+import ollama
+from langchain_core.caches import BaseCache
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import Generation, LLMResult
+from langchain_ollama import ChatOllama
+# from langchain_openai import ChatOpenAI
+
+from cache import DiskCache, make_key
+from configration import Configration
+from replay import ReplayLLMCache, generations_from_json, generations_to_json, replay_store, stable_prompt
+
+# Ollama reports durations in nanoseconds
+NANOSECONDS = 1e9
+
+_semaphore_lock = threading.Lock()
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+_llm_cache: DiskCache | None = None
+_llm_cache_lock = threading.Lock()
+
+
+class LLMResponseCache(BaseCache):
+    """LangChain cache serving repeated chat model calls from a DiskCache
+
+    Keys hash the model and temperature, the messages (without per-call ids and
+    timings) and ChatOllama's ``llm_string``, which carries any bound output schema or
+    tools, so a structured-output call never shares an entry with a free-text one.
+
+    Args:
+        cache (DiskCache): Where responses live
+        namespace (str): Model name and settings; ChatOllama leaves them out of its
+            ``llm_string``, so they are added to the key here
+    """
+
+    def __init__(self, cache: DiskCache, namespace: str):
+        self.cache = cache
+        self.namespace = namespace
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        return make_key("response", self.namespace, stable_prompt(prompt), llm_string)
+
+    def lookup(self, prompt: str, llm_string: str) -> Sequence[Generation] | None:
+        cached = self.cache.get(self._key(prompt, llm_string))
+        if cached is None:
+            return None
+        generations = generations_from_json(json.loads(cached))
+        for generation in generations:
+            # The stored Ollama timings belong to the original call; flag them for LLMTimings
+            generation.message.response_metadata["cache_hit"] = True
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        self.cache.set(self._key(prompt, llm_string), json.dumps(generations_to_json(return_val)))
+
+    def clear(self, **kwargs: Any) -> None:
+        self.cache.clear()
+
+
+class LLMTimings(BaseCallbackHandler):
+    """Ollama-reported time to first token of every chat model call, by graph node
+
+    The time to first token is the model load plus the prompt evaluation time. When
+    Ollama reuses the KV cache of an identical prompt prefix, only the tokens after it
+    are evaluated, which shows up as a lower ``prompt_tokens`` and time to first token.
+    Calls served from the LLM response cache are not counted.
+    """
+
+    def __init__(self):
+        self.calls: list[dict] = []
+        self._nodes: dict[UUID, str] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized: dict, messages: list, *, run_id: UUID, metadata: dict | None = None, **kwargs: Any) -> None:
+        with self._lock:
+            self._nodes[run_id] = (metadata or {}).get("langgraph_node", "-")
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            node = self._nodes.pop(run_id, "-")
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "response_metadata", None) or {}
+                if metadata.get("cache_hit") or "prompt_eval_duration" not in metadata:
+                    continue
+                load = (metadata.get("load_duration") or 0) / NANOSECONDS
+                with self._lock:
+                    self.calls.append({
+                        "node": node,
+                        "ttft": load + metadata["prompt_eval_duration"] / NANOSECONDS,
+                        "load": load,
+                        "prompt_tokens": metadata.get("prompt_eval_count") or 0,
+                    })
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            self._nodes.pop(run_id, None)
+
+    def summary(self) -> dict[str, dict]:
+        """Per node: number of calls, first/mean/max time to first token and mean evaluated prompt tokens"""
+        with self._lock:
+            calls = list(self.calls)
+        nodes: dict[str, list[dict]] = {}
+        for call in calls:
+            nodes.setdefault(call["node"], []).append(call)
+        return {
+            node: {
+                "calls": len(node_calls),
+                "first_ttft": node_calls[0]["ttft"],
+                "mean_ttft": sum(call["ttft"] for call in node_calls) / len(node_calls),
+                "max_ttft": max(call["ttft"] for call in node_calls),
+                "mean_prompt_tokens": sum(call["prompt_tokens"] for call in node_calls) / len(node_calls),
+            }
+            for node, node_calls in nodes.items()
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls.clear()
+
+
+LLM_TIMINGS = LLMTimings()
+
+
+def llm_cache(enabled: bool | None = None) -> DiskCache | None:
+    """Shared LLM response cache, or None when it is disabled or while recording or replaying
+
+    Args:
+        enabled (bool | None): Per-node override of the ``llm_cache`` setting, used when not None
+    """
+    global _llm_cache
+    configurable = Configration.from_runnable_config()
+    if not (configurable.llm_cache if enabled is None else enabled) or replay_store() is not None:
+        return None
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = DiskCache(
+                configurable.research_root().joinpath("llm_cache.db"), max_entries=configurable.llm_cache_size
+            )
+    return _llm_cache
+
+
+def llm_cache_stats() -> dict:
+    """Hit/miss counters of the LLM response cache for this process"""
+    # Read the global so nodes that opted in are counted even when the cache is off by default
+    cache = _llm_cache
+    return cache.stats() if cache is not None else {"hits": 0, "misses": 0, "hit_rate": 0.0, "entries": 0}
+
+
+@lru_cache(maxsize=None)
+def get_llm(model: str | None = None, temperature: float = 0.7, cache: bool | None = None) -> ChatOllama:
+    """Shared chat model for the research and writer agents
+
+    With ``replay_mode`` set, every call is recorded to or replayed from the replay store.
+    Otherwise responses go through the on-disk LLM response cache when it is enabled.
+    Models stay loaded for ``llm_keep_alive`` and every call is timed by ``LLM_TIMINGS``.
+
+    Args:
+        model (str | None): Ollama model name, defaults to ``query_generation_model``
+        temperature (float): Sampling temperature
+        cache (bool | None): Opt this node in (True) or out (False) of the response
+            cache; None follows the ``llm_cache`` setting
+
+    Returns:
+        ChatOllama: One instance per (model, temperature, cache)
+    """
+    configurable = Configration.from_runnable_config()
+    model = model or configurable.query_generation_model
+    namespace = f"{model}:{temperature}"
+    store = replay_store()
+    if store is not None:
+        response_cache = ReplayLLMCache(store, namespace)
+    else:
+        responses = llm_cache(enabled=cache)
+        response_cache = LLMResponseCache(responses, namespace) if responses is not None else None
+    # cache=False rather than None so an opted-out node also ignores any global LangChain cache
+    return ChatOllama(
+        model=model,
+        temperature=temperature,
+        keep_alive=configurable.llm_keep_alive,
+        cache=response_cache if response_cache is not None else False,
+        callbacks=[LLM_TIMINGS],
+    )
+
+
+def configured_models() -> dict[str, str]:
+    """Ollama models the configuration uses, each mapped to its kind: chat or embedding"""
+    configurable = Configration.from_runnable_config()
+    models = {configurable.query_generation_model: "chat"}
+    if configurable.embedding_backend == "ollama":
+        models.setdefault(configurable.embedding_model, "embedding")
+    return models
+
+
+def warm_up(models: dict[str, str] | None = None) -> None:
+    """Load models into Ollama ahead of the first node call
+
+    Chat models get an empty generate request, which loads a model without running it;
+    embedding models embed a short text. Both use the configured ``llm_keep_alive``.
+    Skipped when ``llm_warmup`` is off or calls are replayed.
+
+    Args:
+        models (dict[str, str] | None): Model names mapped to "chat" or "embedding",
+            defaults to ``configured_models()``
+    """
+    configurable = Configration.from_runnable_config()
+    if not configurable.llm_warmup or configurable.replay_mode == "replay":
+        return
+    client = ollama.Client()
+    for model, kind in (configured_models() if models is None else models).items():
+        start = time.perf_counter()
+        try:
+            if kind == "embedding":
+                client.embed(model=model, input="warm up", keep_alive=configurable.llm_keep_alive)
+            else:
+                client.generate(model=model, keep_alive=configurable.llm_keep_alive)
+        except Exception as e:
+            print(f"[warm_up] Could not load {model}: {e}")
+            continue
+        print(f"[warm_up] {model} loaded in {time.perf_counter() - start:.1f}s")
+
+
+def start_warm_up(models: dict[str, str] | None = None) -> threading.Thread:
+    """Run ``warm_up`` in a background thread, e.g. while the user types the question"""
+    thread = threading.Thread(target=warm_up, args=(models,), name="llm-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def llm_semaphore() -> asyncio.Semaphore:
+    """Semaphore bounding in-flight LLM calls on the running event loop to ``llm_concurrency``"""
+    loop = asyncio.get_running_loop()
+    with _semaphore_lock:
+        if loop not in _semaphores:
+            _semaphores[loop] = asyncio.Semaphore(Configration.from_runnable_config().llm_concurrency)
+        return _semaphores[loop]
+
+
+async def ainvoke(runnable, prompt: Any) -> Any:
+    """``await runnable.ainvoke(prompt)`` while holding one of the shared LLM slots
+
+    Args:
+        runnable: Chat model or structured-output runnable
+        prompt (Any): Messages or prompt string
+
+    Returns:
+        Any: The runnable's response
+    """
+    async with llm_semaphore():
+        return await runnable.ainvoke(prompt)
@@ -0,0 +1,72 @@
+import asyncio
+from typing import Awaitable, Callable
+
+SEPARATOR = "\n\n"
+
+
+def chunk_texts(texts: list[str], max_tokens: int, count_tokens: Callable[[str], int]) -> list[str]:
+    """Pack texts in order into chunks of at most ``max_tokens`` tokens
+
+    Packing is greedy and order-preserving, so appending texts only changes the last
+    chunk and the ones after it. A text longer than ``max_tokens`` is cut into pieces
+    at word boundaries.
+
+    Args:
+        texts (list[str]): Texts in their stored order
+        max_tokens (int): Token budget of one chunk
+        count_tokens (Callable[[str], int]): Token counter, e.g. ``TokenManger.count_string_tokens``
+
+    Returns:
+        list[str]: Chunks, texts joined by blank lines
+    """
+    chunks, current, used = [], [], 0
+    for text in texts:
+        tokens = count_tokens(text)
+        pieces = [(text, tokens)]
+        if tokens > max_tokens:
+            words = text.split()
+            step = max(len(words) * max_tokens // tokens, 1)
+            pieces = [(" ".join(words[start:start + step]), max_tokens) for start in range(0, len(words), step)]
+        for piece, piece_tokens in pieces:
+            if current and used + piece_tokens > max_tokens:
+                chunks.append(SEPARATOR.join(current))
+                current, used = [], 0
+            current.append(piece)
+            used += piece_tokens
+    if current:
+        chunks.append(SEPARATOR.join(current))
+    return chunks
+
+
+async def map_reduce(
+    texts: list[str],
+    summarize: Callable[[str], Awaitable[str]],
+    max_tokens: int,
+    count_tokens: Callable[[str], int],
+) -> str:
+    """Summarize a corpus larger than the model context
+
+    The texts are packed into chunks that are summarized concurrently (map); the
+    summaries are then packed and summarized again (reduce) until one summary is left.
+
+    Args:
+        texts (list[str]): Corpus, one entry per record
+        summarize (Callable[[str], Awaitable[str]]): Summarizes one chunk
+        max_tokens (int): Token budget of a chunk sent to ``summarize``
+        count_tokens (Callable[[str], int]): Token counter
+
+    Returns:
+        str: Summary of the whole corpus
+    """
+    chunks = chunk_texts(texts, max_tokens, count_tokens)
+    level = 0
+    while True:
+        summaries = list(await asyncio.gather(*(summarize(chunk) for chunk in chunks)))
+        print(f"[map_reduce] Level {level}: summarized {len(chunks)} chunks")
+        if len(summaries) <= 1:
+            return summaries[0] if summaries else ""
+        chunks = chunk_texts(summaries, max_tokens, count_tokens)
+        if len(chunks) >= len(summaries):
+            # Summaries too long to pack: merge them pairwise so every level shrinks
+            chunks = [SEPARATOR.join(summaries[start:start + 2]) for start in range(0, len(summaries), 2)]
+        level += 1
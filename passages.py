@@ -0,0 +1,106 @@
+import re
+from typing import Callable, Iterable
+
+from bm25 import BM25Index
+
+# Words per passage and words shared by consecutive passages of the same source
+PASSAGE_WORDS = 120
+PASSAGE_OVERLAP = 20
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_passages(text: str, max_words: int = PASSAGE_WORDS, overlap: int = PASSAGE_OVERLAP) -> list[str]:
+    """Split text into passages of about ``max_words`` words, cut at sentence ends where possible
+
+    Args:
+        text (str): Text to split
+        max_words (int): Upper bound on words per passage; longer sentences are cut
+        overlap (int): Trailing words of a passage repeated at the start of the next one
+
+    Returns:
+        list[str]: Passages in reading order
+    """
+    # Every passage must add new words, or the loop below never advances
+    max_words = max(max_words, 1)
+    overlap = min(overlap, max_words // 2)
+    words: list[str] = []
+    passages = []
+    for sentence in SENTENCE_END.split(text.strip()):
+        sentence_words = sentence.split()
+        while sentence_words:
+            room = max_words - len(words)
+            if len(sentence_words) > room and words and len(words) > overlap:
+                passages.append(" ".join(words))
+                words = words[-overlap:] if overlap else []
+                continue
+            words += sentence_words[:room]
+            sentence_words = sentence_words[room:]
+    if words and (not passages or len(words) > overlap):
+        passages.append(" ".join(words))
+    return passages
+
+
+def source_passages(sources: Iterable[dict], max_words: int = PASSAGE_WORDS) -> list[dict]:
+    """Passages of every source, each with the ``id``, ``url`` and ``title`` of its source"""
+    passages = []
+    for source in sources:
+        for text in split_passages(source.get("content") or "", max_words):
+            passages.append({"source_id": source.get("id"), "url": source.get("url"), "title": source.get("title", ""), "text": text})
+    return passages
+
+
+def select_passages(
+    passages: list[dict],
+    query: str,
+    token_budget: int,
+    count_tokens: Callable[[str], int],
+    top_k: int | None = None,
+) -> list[dict]:
+    """Most relevant passages for a query that fit in a token budget
+
+    Passages are ranked by BM25 against the query and taken best first, skipping any
+    that would overflow the budget. If the query matches nothing the passages are
+    taken in their original order.
+
+    Args:
+        passages (list[dict]): Passages with a ``text`` key
+        query (str): Section label, task or other text to rank against
+        token_budget (int): Maximum total tokens of the selected passages
+        count_tokens (Callable[[str], int]): Token counter, e.g. ``TokenManger.count_string_tokens``
+        top_k (int | None): Maximum number of passages, unlimited if None
+
+    Returns:
+        list[dict]: Selected passages with their ``score``, best first
+    """
+    index = BM25Index()
+    for position, passage in enumerate(passages):
+        index.add(f"{passage.get('title', '')} {passage['text']}", {"position": position})
+    ranked = [(score, meta["position"]) for score, meta in index.search(query, top_k=len(passages))]
+    if not ranked:
+        ranked = [(0.0, position) for position in range(len(passages))]
+
+    selected, used = [], 0
+    for score, position in ranked:
+        cost = count_tokens(passages[position]["text"])
+        if used + cost > token_budget:
+            continue
+        selected.append({**passages[position], "score": score})
+        used += cost
+        if top_k is not None and len(selected) == top_k:
+            break
+    if not selected and ranked and token_budget > 0:
+        # Even the best passage is over budget: keep as much of it as fits
+        score, position = ranked[0]
+        words = passages[position]["text"].split()
+        cost = max(count_tokens(passages[position]["text"]), 1)
+        text = " ".join(words[:max(len(words) * token_budget // cost, 1)])
+        selected.append({**passages[position], "text": text, "score": score})
+    return selected
+
+
+def format_passages(passages: list[dict]) -> str:
+    """Render selected passages for a prompt, each labelled with its source"""
+    return "\n\n".join(
+        f"[{passage.get('title') or 'Untitled'}]({passage.get('url') or 'no url'})\n{passage['text']}" for passage in passages
+    )
@@ -287,8 +287,7 @@ The project requires registration of a new domain name as part of the setup proc
 question_generator = """
 You are a follow-up question generator. Given a Search results, a specific research task, and desired number of questions, generate relevant follow-up search queries in structured format.
 
-Make sure you follow the research task 
-Research task: {research_task}
+Make sure you follow the research task given in the input.
 
 Your follow-up queries should:
 1. Align with the specific research task provided
@@ -304,16 +303,17 @@ Keep queries:
 - Varied in focus (don't ask the same thing multiple ways)
 - Concise (under 15 words each)
 
-Input:
-- Search results: {search_result}
-- Number of questions: {number_of_question}
+Input (provided by the user):
+- Research task: the task the queries must serve
+- Search results: results of the initial search
+- Number of questions: how many queries to generate
 
 Output format (JSON):
-[{{
+[{
   "id": <unique_integer>,
   "query": "query 1",
   "rationale": "<brief explanation of why this query is relevant to the research task and user question>"
-}}]
+}]
 
 Return only valid JSON matching the SearchQuery schema. No markdown, no explanations outside the JSON.
 """
@@ -0,0 +1,175 @@
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Any, Callable, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+from cache import DiskCache, make_key
+from configration import Configration
+
+# Recordings are never evicted; a full research run makes a few hundred calls
+REPLAY_MAX_ENTRIES = 1_000_000
+# Per-call fields that differ between otherwise identical prompts (message ids, Ollama timings)
+VOLATILE_FIELDS = ("id", "response_metadata", "usage_metadata")
+
+_replay_store: "ReplayStore | None" = None
+_replay_store_lock = threading.Lock()
+
+
+class ReplayMiss(LookupError):
+    """Raised in replay mode when a call was never recorded"""
+
+
+class ReplayStore:
+    """Recorded request/response pairs for deterministic end-to-end runs.
+
+    In ``record`` mode every call goes to the real LLM or search API and its response
+    and latency are stored under a stable hash of the request (and how many times the
+    same request was already made in this run). In ``replay`` mode the
+    responses are served back, sleeping ``latency_scale`` times the recorded latency
+    (0 serves them instantly), and a request that was never recorded raises ReplayMiss.
+    """
+
+    def __init__(self, path: str | Path, mode: str, latency_scale: float = 0.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown replay mode '{mode}', expected 'record' or 'replay'")
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.cache = DiskCache(path, max_entries=REPLAY_MAX_ENTRIES)
+        self._started: dict[str, float] = {}
+        self._calls: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def new_run(self) -> None:
+        """Start counting repeated requests afresh, e.g. before each benchmark run"""
+        with self._lock:
+            self._calls.clear()
+
+    def _sequenced(self, key: str) -> str:
+        # The same request made several times in one run (e.g. identical prompts for two
+        # tasks) may get different responses; each occurrence is stored under its own key
+        with self._lock:
+            count = self._calls.get(key, 0)
+            self._calls[key] = count + 1
+        return key if count == 0 else f"{key}#{count}"
+
+    def start(self, key: str) -> None:
+        """Mark the moment a call to be recorded under ``key`` is sent"""
+        with self._lock:
+            self._started[key] = time.perf_counter()
+
+    def record(self, key: str, value: Any) -> None:
+        """Store the response of a call started with ``start``"""
+        with self._lock:
+            started = self._started.pop(key, None)
+        latency = time.perf_counter() - started if started is not None else 0.0
+        self.cache.set(self._sequenced(key), json.dumps({"value": value, "latency": latency}))
+
+    def replay(self, key: str, description: str = "") -> Any:
+        """Recorded response for ``key``, after the simulated latency"""
+        sequenced = self._sequenced(key)
+        cached = self.cache.get(sequenced)
+        if cached is None and sequenced != key:
+            # Called more often than when recorded: serve the first recording
+            cached = self.cache.get(key)
+        if cached is None:
+            raise ReplayMiss(f"No recorded response for {description or key}; run once with REPLAY_MODE=record")
+        entry = json.loads(cached)
+        if self.latency_scale > 0:
+            time.sleep(entry["latency"] * self.latency_scale)
+        return entry["value"]
+
+    def call(self, key: str, func: Callable[[], Any], description: str = "") -> Any:
+        """Record ``func()`` under ``key``, or replay what it returned when it was recorded"""
+        if self.mode == "replay":
+            return self.replay(key, description)
+        self.start(key)
+        value = func()
+        self.record(key, value)
+        return value
+
+
+def replay_store() -> ReplayStore | None:
+    """Shared record/replay store, or None when ``replay_mode`` is off"""
+    global _replay_store
+    configurable = Configration.from_runnable_config()
+    if configurable.replay_mode == "off":
+        return None
+    with _replay_store_lock:
+        if _replay_store is None:
+            _replay_store = ReplayStore(
+                configurable.replay_path or configurable.research_root().joinpath("replay.db"),
+                configurable.replay_mode,
+                configurable.replay_latency_scale,
+            )
+    return _replay_store
+
+
+def stable_prompt(prompt: str) -> str:
+    """Serialized chat prompt with per-call ids and timing metadata removed"""
+    def strip(node):
+        if isinstance(node, dict):
+            return {
+                key: strip(value) for key, value in node.items()
+                if not (key in VOLATILE_FIELDS and not isinstance(value, list))
+            }
+        if isinstance(node, list):
+            return [strip(value) for value in node]
+        return node
+
+    try:
+        return json.dumps(strip(json.loads(prompt)), sort_keys=True)
+    except ValueError:
+        return prompt
+
+
+def generations_to_json(generations: Sequence[Generation]) -> list[dict]:
+    """JSON-serializable form of chat generations"""
+    return [
+        {"message": message_to_dict(generation.message), "generation_info": generation.generation_info}
+        for generation in generations
+        if isinstance(generation, ChatGeneration)
+    ]
+
+
+def generations_from_json(data: list[dict]) -> list[ChatGeneration]:
+    """Chat generations back from ``generations_to_json`` output"""
+    return [
+        ChatGeneration(message=messages_from_dict([generation["message"]])[0], generation_info=generation["generation_info"])
+        for generation in data
+    ]
+
+
+class ReplayLLMCache(BaseCache):
+    """LangChain cache that records or replays chat model calls through a ReplayStore
+
+    Args:
+        store (ReplayStore): Where recordings live
+        namespace (str): Model name and temperature, keyed as in LLMResponseCache
+    """
+
+    def __init__(self, store: ReplayStore, namespace: str):
+        self.store = store
+        self.namespace = namespace
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        return make_key("llm", self.namespace, stable_prompt(prompt), llm_string)
+
+    def lookup(self, prompt: str, llm_string: str) -> Sequence[Generation] | None:
+        key = self._key(prompt, llm_string)
+        if self.store.mode == "record":
+            self.store.start(key)
+            return None
+        return generations_from_json(self.store.replay(key, f"LLM call to {self.namespace}"))
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        if self.store.mode != "record":
+            return
+        self.store.record(self._key(prompt, llm_string), generations_to_json(return_val))
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.cache.clear()
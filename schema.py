@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Literal, Optional
 
 
@@ -69,4 +69,20 @@ class QualityCheck(BaseModel):
     feedback: List[str] = Field(
         description="List of specific quality issues, missing content areas, or suggestions for improvement. Be precise about what needs fixing."
     )
-    
\ No newline at end of file
+    
+
+
+class SearchResult(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    url: str = Field(description="Address of the page")
+    title: str = Field(default="", description="Title of the page")
+    content: str = Field(default="", description="Snippet of the page relevant to the query")
+    score: Optional[float] = Field(default=None, description="Relevance score given by the search backend")
+
+
+class SearchResponse(BaseModel):
+    query: str = Field(default="", description="Query that was searched")
+    answer: Optional[str] = Field(default=None, description="Short answer to the query, if the backend gives one")
+    results: List[SearchResult] = Field(default_factory=list, description="Search results, best first")
+    error: Optional[str] = Field(default=None, description="Why the search failed; results are empty when set")
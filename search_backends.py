@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Callable
+
+from bm25 import BM25Index
+from cache import make_key
+from configration import Configration
+from replay import ReplayStore
+from search_client import CircuitBreaker, SearchClient
+
+# Words per passage when local corpus documents are split for ranking
+PASSAGE_WORDS = 200
+
+
+class SearchBackend(ABC):
+    """Interface every web search backend implements.
+
+    ``search`` returns a Tavily-shaped response: ``{"query", "answer", "results": [{"url",
+    "title", "content", "score", ...}], "response_time"}``, so the nodes consuming search
+    results never need to know which backend produced them.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def search(self, query: str, search_depth: str = "advanced", max_results: int = 5, time_range: str = "year") -> dict:
+        """Run one search and return its Tavily-shaped response"""
+
+
+class TavilyBackend(SearchBackend):
+    """Web search through the Tavily API, via the shared rate-limited SearchClient"""
+
+    name = "tavily"
+
+    def __init__(self, api_key: str | None = None):
+        configurable = Configration.from_runnable_config()
+        self.client = SearchClient(
+            api_key or os.getenv("TAVILY_API_KEY"),
+            rate=configurable.search_rate_limit,
+            burst=configurable.search_burst,
+            max_retries=configurable.search_max_retries,
+            pool_size=configurable.search_pool_size,
+            timeout=configurable.search_request_timeout,
+            breaker=CircuitBreaker(configurable.search_breaker_threshold, configurable.search_breaker_reset),
+        )
+
+    def search(self, query: str, search_depth: str = "advanced", max_results: int = 5, time_range: str = "year") -> dict:
+        return self.client.search(
+            query=query,
+            max_results=max_results,
+            search_depth=search_depth,
+            include_answer=True,
+            include_images=False,
+            time_range=time_range,
+            # No start_date or end_date
+        )
+
+
+class LocalCorpusBackend(SearchBackend):
+    """Offline search over an on-disk document corpus ranked with BM25.
+
+    The corpus directory may hold ``.txt``/``.md`` files (title from the file name) and
+    ``.json``/``.jsonl`` files with ``{"url", "title", "content"}`` objects, e.g. sources
+    exported from earlier research runs. Documents are split into passages; a query
+    returns the best passage of each of the top matching documents. ``search_depth`` and
+    ``time_range`` are accepted for interface compatibility and ignored.
+    """
+
+    name = "local"
+
+    def __init__(self, corpus_dir: str | Path):
+        self.corpus_dir = Path(corpus_dir)
+        self.index = BM25Index()
+        for document in self._documents():
+            words = document["content"].split()
+            for start in range(0, max(len(words), 1), PASSAGE_WORDS):
+                passage = " ".join(words[start:start + PASSAGE_WORDS])
+                self.index.add(f"{document['title']} {passage}", {**document, "content": passage})
+        print(f"[LocalCorpusBackend] Indexed {len(self.index)} passages from {self.corpus_dir}")
+
+    def _documents(self):
+        if not self.corpus_dir.is_dir():
+            raise FileNotFoundError(f"Search corpus directory not found: {self.corpus_dir}")
+        for path in sorted(self.corpus_dir.rglob("*")):
+            if path.suffix in (".txt", ".md"):
+                yield {"url": path.resolve().as_uri(), "title": path.stem.replace("_", " "), "content": path.read_text(encoding="utf-8")}
+            elif path.suffix in (".json", ".jsonl"):
+                text = path.read_text(encoding="utf-8")
+                items = [json.loads(line) for line in text.splitlines() if line.strip()] if path.suffix == ".jsonl" else json.loads(text)
+                for count, item in enumerate(items if isinstance(items, list) else [items]):
+                    if isinstance(item, dict) and item.get("content"):
+                        yield {
+                            "url": item.get("url") or f"{path.resolve().as_uri()}#{count}",
+                            "title": item.get("title") or path.stem,
+                            "content": item["content"],
+                        }
+
+    def search(self, query: str, search_depth: str = "advanced", max_results: int = 5, time_range: str = "year") -> dict:
+        start = time.perf_counter()
+        results, seen = [], set()
+        for score, passage in self.index.search(query, top_k=max_results * 4):
+            if passage["url"] in seen:
+                continue
+            seen.add(passage["url"])
+            results.append({**passage, "score": score, "raw_content": None})
+            if len(results) == max_results:
+                break
+        return {
+            "query": query,
+            "follow_up_questions": None,
+            "answer": results[0]["content"][:500] if results else None,
+            "images": [],
+            "results": results,
+            "response_time": round(time.perf_counter() - start, 4),
+        }
+
+
+class ReplayBackend(SearchBackend):
+    """Records or replays the responses of another backend through a ReplayStore
+
+    The wrapped backend is only built when a search has to be recorded, so replaying
+    needs neither network access nor an API key.
+    """
+
+    def __init__(self, name: str, build: Callable[[], SearchBackend], store: ReplayStore):
+        self.name = name
+        self.build = build
+        self.store = store
+
+    def search(self, query: str, search_depth: str = "advanced", max_results: int = 5, time_range: str = "year") -> dict:
+        key = make_key("search", self.name, query, search_depth, max_results, time_range)
+        return self.store.call(
+            key,
+            lambda: self.build().search(query, search_depth=search_depth, max_results=max_results, time_range=time_range),
+            f"{self.name} search '{query}'",
+        )
+
+
+BACKENDS = {"tavily": TavilyBackend, "local": LocalCorpusBackend}
+
+_lock = threading.Lock()
+_backends: dict[tuple, SearchBackend] = {}
+
+
+def get_backend(name: str, corpus_dir: str | None = None) -> SearchBackend:
+    """Build a search backend by name once per process
+
+    Args:
+        name (str): "tavily" or "local"
+        corpus_dir (str | None): Corpus directory for the local backend
+
+    Returns:
+        SearchBackend: The shared backend instance
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown search backend '{name}', expected one of {sorted(BACKENDS)}")
+    if name == "local" and not corpus_dir:
+        raise ValueError("search_backend=local needs search_corpus_dir (SEARCH_CORPUS_DIR) pointing at the corpus folder")
+    key = (name, corpus_dir)
+    with _lock:
+        if key not in _backends:
+            _backends[key] = BACKENDS[name](corpus_dir) if name == "local" else BACKENDS[name]()
+        return _backends[key]
@@ -0,0 +1,187 @@
+import time
+import random
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Responses worth retrying: rate limited or a transient server-side failure
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class SearchAPIError(RuntimeError):
+    """A search request failed for good, after any retries"""
+
+    def __init__(self, message: str, status: int | None = None):
+        super().__init__(message)
+        self.status = status
+
+
+class CircuitOpenError(SearchAPIError):
+    """The circuit breaker is open, so the request was not sent"""
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` requests per second with bursts of up to ``capacity``"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a token is available and take it"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Stops sending requests after ``threshold`` consecutive failures.
+
+    While open every request fails fast; after ``reset_timeout`` seconds one trial
+    request is let through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self._trial and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._trial = True
+                return True
+            return False
+
+    def success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                self._trial = False
+
+
+class SearchClient:
+    """Tavily search client shared by every thread of the process.
+
+    Requests go through one keep-alive connection pool, are paced by a token bucket and
+    retried on 429/5xx and connection errors with full-jitter exponential backoff
+    (honouring ``Retry-After``). Repeated failures open a circuit breaker so a failing
+    API is not hammered by the whole fan-out.
+
+    Args:
+        api_key (str): Tavily API key
+        rate (float): Sustained requests per second allowed by the plan
+        burst (int): Requests that may be sent back to back
+        max_retries (int): Retries per request after the first attempt
+        backoff_base (float): First backoff in seconds, doubled on every retry
+        backoff_max (float): Upper bound of a single backoff
+        pool_size (int): Kept-alive connections
+        timeout (float): Seconds allowed per HTTP request
+        breaker (CircuitBreaker | None): Defaults to 5 failures / 30 s
+        base_url (str): API root
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        rate: float = 1.5,
+        burst: int = 5,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        pool_size: int = 10,
+        timeout: float = 30.0,
+        breaker: CircuitBreaker | None = None,
+        base_url: str = "https://api.tavily.com",
+    ):
+        if not api_key:
+            raise ValueError("Tavily Key not Found.")
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.headers.update({"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"})
+
+    def _backoff(self, attempt: int, retry_after: str | None = None) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def search(self, **payload) -> dict:
+        """POST a search request
+
+        Args:
+            **payload: Tavily search parameters (query, search_depth, max_results, ...)
+
+        Returns:
+            dict: Tavily response
+
+        Raises:
+            CircuitOpenError: The breaker is open
+            SearchAPIError: A non-retryable error, or retries were exhausted
+        """
+        last_error = "no attempt made"
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"Search circuit open after repeated failures; last error: {last_error}")
+            self.bucket.acquire()
+            retry_after = None
+            healthy = False
+            try:
+                response = self.session.post(f"{self.base_url}/search", json=payload, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                last_error = f"{type(e).__name__}: {e}"
+            else:
+                if response.status_code == 200:
+                    result = response.json()
+                    healthy = True
+                    return result
+                last_error = f"HTTP {response.status_code}: {response.text[:200]}"
+                if response.status_code not in RETRY_STATUSES:
+                    # The API answered; the request itself was rejected
+                    healthy = True
+                    raise SearchAPIError(last_error, response.status_code)
+                retry_after = response.headers.get("Retry-After")
+            finally:
+                # Every attempt reports its outcome, so a half-open trial always releases its slot
+                if healthy:
+                    self.breaker.success()
+                else:
+                    self.breaker.failure()
+            if attempt < self.max_retries:
+                delay = self._backoff(attempt, retry_after)
+                print(f"[SearchClient] {last_error}; retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+        raise SearchAPIError(f"Search failed after {self.max_retries + 1} attempts: {last_error}")
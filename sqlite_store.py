@@ -0,0 +1,200 @@
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator
+
+_lock = threading.RLock()
+_connections: dict[str, sqlite3.Connection] = {}
+_tables: set[tuple[str, str]] = set()
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """Open (once per process) the single-file research database
+
+    Args:
+        db_path (str): Path of the SQLite file, created if missing
+
+    Returns:
+        sqlite3.Connection: Shared connection, guarded by the module lock
+    """
+    with _lock:
+        if db_path not in _connections:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            _connections[db_path] = conn
+        return _connections[db_path]
+
+
+def _ensure_table(conn: sqlite3.Connection, db_path: str, kind: str) -> None:
+    """Create the table for a research kind with its lookup indexes"""
+    if (db_path, kind) in _tables:
+        return
+    if kind == "todo":
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS todo (
+                thread_id TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                status TEXT,
+                date TEXT,
+                data TEXT NOT NULL,
+                PRIMARY KEY (thread_id, id)
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS todo_status ON todo (thread_id, status)")
+    else:
+        conn.execute(
+            f"""CREATE TABLE IF NOT EXISTS "{kind}" (
+                row_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                thread_id TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                url TEXT,
+                date TEXT,
+                data TEXT NOT NULL
+            )"""
+        )
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "{kind}_thread_id" ON "{kind}" (thread_id, id)')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "{kind}_url" ON "{kind}" (thread_id, url)')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "{kind}_date" ON "{kind}" (thread_id, date)')
+    conn.commit()
+    _tables.add((db_path, kind))
+
+
+def insert_records(db_path: str, kind: str, thread_id: str, records: list[dict]) -> list[dict]:
+    """Insert records for a thread, assigning sequential ids like the file store
+
+    Args:
+        db_path (str): Path of the SQLite file
+        kind (str): Table name, a ``DirectoryMapping`` value
+        thread_id (str): thread the records belong to
+        records (list[dict]): Records to insert
+
+    Returns:
+        list[dict]: The inserted records with their assigned ids
+    """
+    conn = connect(db_path)
+    date = f"{datetime.now().date()}"
+    with _lock:
+        _ensure_table(conn, db_path, kind)
+        with conn:
+            (last_id,) = conn.execute(
+                f'SELECT COALESCE(MAX(id), 0) FROM "{kind}" WHERE thread_id = ?', (thread_id,)
+            ).fetchone()
+            rows = []
+            for offset, record in enumerate(records, start=1):
+                record["id"] = last_id + offset
+                rows.append((thread_id, record["id"], record.get("url"), date, json.dumps(record, ensure_ascii=False)))
+            conn.executemany(
+                f'INSERT INTO "{kind}" (thread_id, id, url, date, data) VALUES (?, ?, ?, ?, ?)', rows
+            )
+    return records
+
+
+def select_records(db_path: str, kind: str, thread_id: str, where: dict | None = None) -> list[dict]:
+    """Indexed lookup of a thread's records
+
+    Args:
+        db_path (str): Path of the SQLite file
+        kind (str): Table name, a ``DirectoryMapping`` value
+        thread_id (str): thread the records belong to
+        where (dict | None): Optional equality filters on the indexed ``id``, ``url`` or ``date`` columns
+
+    Returns:
+        list[dict]: Matching records in insertion order
+    """
+    conn = connect(db_path)
+    where = where or {}
+    clauses = ["thread_id = ?"] + [f"{column} = ?" for column in where if column in ("id", "url", "date")]
+    params = [thread_id] + [value for column, value in where.items() if column in ("id", "url", "date")]
+    with _lock:
+        _ensure_table(conn, db_path, kind)
+        order = "id" if kind == "todo" else "row_id"
+        rows = conn.execute(
+            f'SELECT data FROM "{kind}" WHERE {" AND ".join(clauses)} ORDER BY {order}', params
+        ).fetchall()
+    return [json.loads(data) for (data,) in rows]
+
+
+def iter_records(db_path: str, kind: str, thread_id: str, page_size: int = 500) -> Iterator[dict]:
+    """Stream a thread's records page by page, keyset-paginated on the primary key"""
+    conn = connect(db_path)
+    last_row = 0
+    while True:
+        with _lock:
+            _ensure_table(conn, db_path, kind)
+            rows = conn.execute(
+                f'SELECT row_id, data FROM "{kind}" WHERE thread_id = ? AND row_id > ? ORDER BY row_id LIMIT ?',
+                (thread_id, last_row, page_size),
+            ).fetchall()
+        for last_row, data in rows:
+            yield json.loads(data)
+        if len(rows) < page_size:
+            return
+
+
+def replace_todos(db_path: str, thread_id: str, todos: list[dict]) -> list[dict]:
+    """Store a freshly generated todo list for a thread, replacing any previous one"""
+    conn = connect(db_path)
+    date = f"{datetime.now().date()}"
+    with _lock:
+        _ensure_table(conn, db_path, "todo")
+        with conn:
+            conn.execute("DELETE FROM todo WHERE thread_id = ?", (thread_id,))
+            conn.executemany(
+                "INSERT INTO todo (thread_id, id, status, date, data) VALUES (?, ?, ?, ?, ?)",
+                [(thread_id, todo["id"], todo.get("status"), date, json.dumps(todo)) for todo in todos],
+            )
+    return todos
+
+
+def update_todo(db_path: str, thread_id: str, content: dict, expected_status: str | None = None) -> bool:
+    """Merge ``content`` into the todo with the same id in a single transaction
+
+    Args:
+        db_path (str): Path of the SQLite file
+        thread_id (str): thread the todo belongs to
+        content (dict): Fields to update, must contain ``id``
+        expected_status (str | None): Only apply the update if the todo currently has this status
+
+    Returns:
+        bool: True if the todo was updated
+    """
+    conn = connect(db_path)
+    with _lock:
+        _ensure_table(conn, db_path, "todo")
+        with conn:
+            row = conn.execute(
+                "SELECT data, status FROM todo WHERE thread_id = ? AND id = ?", (thread_id, content["id"])
+            ).fetchone()
+            if row is None or (expected_status is not None and row[1] != expected_status):
+                return False
+            todo = {**json.loads(row[0]), **content}
+            conn.execute(
+                "UPDATE todo SET status = ?, data = ? WHERE thread_id = ? AND id = ?",
+                (todo.get("status"), json.dumps(todo), thread_id, content["id"]),
+            )
+    return True
+
+
+def copy_thread(db_path: str, thread_id: str, new_thread_id: str) -> None:
+    """Copy every record of a thread, in every table, to another thread id"""
+    conn = connect(db_path)
+    with _lock:
+        with conn:
+            tables = [
+                name for (name,) in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' AND name != 'sqlite_sequence'"
+                )
+            ]
+            for table in tables:
+                columns = ", ".join(
+                    row[1] for row in conn.execute(f'PRAGMA table_info("{table}")') if row[1] not in ("row_id", "thread_id")
+                )
+                conn.execute(
+                    f'INSERT INTO "{table}" (thread_id, {columns}) '
+                    f'SELECT ?, {columns} FROM "{table}" WHERE thread_id = ? ORDER BY rowid',
+                    (new_thread_id, thread_id),
+                )
@@ -0,0 +1,548 @@
+import io
+import os
+import gzip
+import json
+import zlib
+import fcntl
+import atexit
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Iterator
+from uuid import uuid4
+
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional
+    zstandard = None
+
+# Raised while decoding a log whose trailing line or frame was torn by a crash mid-append
+TORN_LOG_ERRORS = (EOFError, gzip.BadGzipFile, UnicodeDecodeError, zlib.error) + (
+    (zstandard.ZstdError,) if zstandard is not None else ()
+)
+
+# Number of appended records after which the log is fsync'ed to disk
+FSYNC_BATCH = 64
+
+# File suffix of a JSONL log for each supported compression
+LOG_SUFFIXES = {"none": ".jsonl", "gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+_lock = threading.RLock()
+_unsynced: dict[Path, int] = {}
+
+
+def _fsync(path: Path) -> None:
+    with open(path, "ab") as file:
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def sync_logs() -> None:
+    """Fsync every log that still has appended records not yet on disk."""
+    with _lock:
+        pending = [path for path, count in _unsynced.items() if count]
+        for path in pending:
+            _fsync(path)
+            _unsynced[path] = 0
+
+
+atexit.register(sync_logs)
+
+
+def log_compression(name: str) -> str | None:
+    """Compression of a log file from its name, or None if it is not a JSONL log"""
+    for compression, suffix in LOG_SUFFIXES.items():
+        if name.endswith(suffix):
+            return compression
+    return None
+
+
+def log_stem(name: str) -> str:
+    """File name without its log or ``.json`` suffix, shared by a file and its recompressed copy"""
+    for suffix in (*LOG_SUFFIXES.values(), ".json"):
+        if name.endswith(suffix):
+            return name.removesuffix(suffix)
+    return name
+
+
+def _zstd():
+    if zstandard is None:
+        raise ImportError("zstd compression needs the 'zstandard' package: pip install zstandard")
+    return zstandard
+
+
+def _open_log(path: Path) -> io.TextIOBase:
+    compression = log_compression(path.name)
+    if compression == "gzip":
+        return gzip.open(path, "rt", encoding="utf-8")
+    if compression == "zstd":
+        reader = _zstd().ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(reader, encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def _encode_frame(data: bytes, compression: str) -> bytes:
+    """Compress one batch as a self-contained frame, so frames can simply be concatenated"""
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    if compression == "zstd":
+        return _zstd().ZstdCompressor(level=3).compress(data)
+    return data
+
+
+def iter_log(path: Path) -> Iterator[dict]:
+    """Stream records back from an append-only JSONL log, decompressing transparently
+
+    Args:
+        path (Path): Log file to read, plain ``.jsonl`` or ``.jsonl.gz``/``.jsonl.zst``
+
+    Yields:
+        dict: One record per line. A torn trailing line or frame left by a crash mid-append is skipped.
+    """
+    with _open_log(path) as file:
+        try:
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Skipping corrupt record in {path.name}: {line[:100]}...")
+        except TORN_LOG_ERRORS as e:
+            print(f"Stopped reading truncated log {path.name}: {e}")
+
+
+def _decompressor(compression: str):
+    if compression == "gzip":
+        return zlib.decompressobj(zlib.MAX_WBITS | 16)
+    return _zstd().ZstdDecompressor().decompressobj()
+
+
+def _last_line_end(path: Path, block: int = 1 << 16) -> int:
+    """Offset just past the last newline of a plain log, read backwards from the end"""
+    with open(path, "rb") as file:
+        end = file.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(end - block, 0)
+            file.seek(start)
+            newline = file.read(end - start).rfind(b"\n")
+            if newline != -1:
+                return start + newline + 1
+            end = start
+    return 0
+
+
+def _complete_length(path: Path, compression: str) -> int:
+    """Bytes at the start of a log taken by complete frames; anything after is a torn frame"""
+    if compression == "none":
+        return _last_line_end(path)
+    end = consumed = 0
+    decompressor = _decompressor(compression)
+    with open(path, "rb") as file:
+        while chunk := file.read(1 << 16):
+            while chunk:
+                try:
+                    decompressor.decompress(chunk)
+                except TORN_LOG_ERRORS:
+                    return end
+                if not decompressor.eof:
+                    consumed += len(chunk)
+                    break
+                # A frame ended inside this chunk; the rest starts the next frame
+                rest = decompressor.unused_data
+                consumed += len(chunk) - len(rest)
+                end = consumed
+                decompressor = _decompressor(compression)
+                chunk = rest
+    return end
+
+
+def repair_log(path: Path) -> int:
+    """Cut a torn trailing line or frame off a log, so the next append does not land behind it
+
+    Returns:
+        int: Size of the log after the repair
+    """
+    size = path.stat().st_size
+    length = _complete_length(path, log_compression(path.name) or "none")
+    if length < size:
+        print(f"Truncating {size - length} bytes of a torn append from {path.name}")
+        with _lock:
+            os.truncate(path, length)
+    return length
+
+
+def write_frame(path: Path, records: list[dict], compression: str = "none") -> int:
+    """Append records as one (optionally compressed) frame of JSON lines, ids untouched
+
+    Returns:
+        int: Number of bytes written to the file
+    """
+    data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+    frame = _encode_frame(data, compression)
+    with _lock:
+        with open(path, "ab") as file:
+            file.write(frame)
+        _unsynced[path] = _unsynced.get(path, 0) + len(records)
+        if _unsynced[path] >= FSYNC_BATCH:
+            _fsync(path)
+            _unsynced[path] = 0
+    return len(frame)
+
+
+def append_records(path: Path, records: list[dict], first_id: int) -> int:
+    """Append records to a JSONL log, one JSON object per line.
+
+    Records get sequential ids starting at ``first_id``. Appends are constant cost:
+    nothing already on disk is read back or rewritten. The log is fsync'ed every
+    ``FSYNC_BATCH`` records and once more at interpreter exit. Logs named
+    ``.jsonl.gz``/``.jsonl.zst`` get each append as its own compressed frame.
+
+    Args:
+        path (Path): Log file, created if missing
+        records (list[dict]): Records to append
+        first_id (int): Id of the first record
+
+    Returns:
+        int: Number of bytes appended
+    """
+    for offset, record in enumerate(records):
+        record["id"] = first_id + offset
+    return write_frame(path, records, log_compression(path.name) or "none")
+
+
+class Manifest:
+    """Per-thread index of the files in each research folder.
+
+    For every folder (``sources``, ``notes``, ``todo`` ...) it records the file list in
+    write order, the active log, and for each file its first record id, record count
+    and size in bytes (the offset the next append lands at). Lookups are served from
+    memory; the manifest is persisted as ``manifest_{thread_id}.json`` next to the
+    folders after every change. It is reconciled with the folders once when loaded,
+    so files written by older versions or not yet recorded after a crash are picked up.
+    """
+
+    def __init__(self, root: Path, thread_id: str, segment_bytes: int = 64 * 1024 * 1024):
+        self.root = root
+        self.thread_id = thread_id
+        self.segment_bytes = segment_bytes
+        self.path = root.joinpath(f"manifest_{thread_id}.json")
+        self.lock = threading.RLock()
+        self.folders: dict[str, dict] = {}
+        if self.path.exists():
+            self.folders = json.loads(self.path.read_text())["folders"]
+        if self._reconcile():
+            self._save()
+
+    def directory(self, folder: str) -> Path:
+        return self.root.joinpath(f"{folder}_{self.thread_id}")
+
+    def _reconcile(self) -> bool:
+        changed = False
+        suffix = f"_{self.thread_id}"
+        if not self.root.is_dir():
+            return changed
+        for directory in self.root.iterdir():
+            folder = directory.name.removesuffix(suffix)
+            # Folder names hold no "_", so "notes_a_b" belongs to thread "a_b", not "b"
+            if directory.name.endswith(suffix) and folder and "_" not in folder and directory.is_dir():
+                changed |= self._reconcile_folder(folder, directory)
+        return changed
+
+    def _reconcile_folder(self, folder: str, directory: Path) -> bool:
+        entry = self.folders.setdefault(folder, {"records": 0, "files": []})
+        known = {file["name"]: file for file in entry["files"]}
+        known_stems = {log_stem(name): file for name, file in known.items()}
+        on_disk = sorted(
+            path for path in directory.iterdir()
+            if path.name.endswith(".json") or log_compression(path.name) is not None
+        )
+        changed = False
+        for path in on_disk:
+            file = known.get(path.name)
+            if file is None and log_stem(path.name) in known_stems:
+                # Left over by an interrupted recompress: the recorded file wins while it still exists
+                file = known_stems[log_stem(path.name)]
+                if directory.joinpath(file["name"]).exists():
+                    continue
+                file["name"] = path.name
+            size = path.stat().st_size
+            if file is not None and file["bytes"] == size:
+                continue
+            if log_compression(path.name) is not None:
+                size = repair_log(path)
+                records = sum(1 for _ in iter_log(path))
+            else:
+                records = len(json.loads(path.read_text() or "[]"))
+            if file is None:
+                file = {"name": path.name, "first_id": 0, "records": 0, "bytes": 0}
+                entry["files"].append(file)
+            file.update(records=records, bytes=size)
+            changed = True
+        if changed:
+            # Known files keep their write order; files found on disk are added in name (date) order
+            entry["files"] = [file for file in entry["files"] if directory.joinpath(file["name"]).exists()]
+            next_id = 1
+            for file in entry["files"]:
+                file["first_id"] = next_id
+                next_id += file["records"]
+            entry["records"] = next_id - 1
+        return changed
+
+    def _save(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        atomic_write_json(self.path, {"thread_id": self.thread_id, "folders": self.folders}, fsync=False)
+
+    def files(self, folder: str) -> list[Path]:
+        """Every file of a folder in write order"""
+        with self.lock:
+            entry = self.folders.get(folder, {"files": []})
+            return [self.directory(folder).joinpath(file["name"]) for file in entry["files"]]
+
+    def current(self, folder: str) -> Path | None:
+        """Most recently created file of a folder, if any"""
+        files = self.files(folder)
+        return files[-1] if files else None
+
+    def records(self, folder: str) -> int:
+        """Number of records stored in a folder"""
+        with self.lock:
+            return self.folders.get(folder, {"records": 0})["records"]
+
+    def locate(self, folder: str, record_id: int) -> Path | None:
+        """File of a folder whose id range holds ``record_id``, if any"""
+        with self.lock:
+            for file in self.folders.get(folder, {"files": []})["files"]:
+                if file["first_id"] <= record_id < file["first_id"] + file["records"]:
+                    return self.directory(folder).joinpath(file["name"])
+        return None
+
+    def register(self, folder: str, name: str, records: int = 0, size: int = 0) -> Path:
+        """Record a new file (e.g. a todo list) as the folder's current file"""
+        with self.lock:
+            entry = self.folders.setdefault(folder, {"records": 0, "files": []})
+            entry["files"].append({"name": name, "first_id": entry["records"] + 1, "records": records, "bytes": size})
+            entry["records"] += records
+            self._save()
+            return self.directory(folder).joinpath(name)
+
+    def append(self, folder: str, records: list[dict], compression: str = "none") -> list[dict]:
+        """Append records to the folder's active log, rolling to a new one past ``segment_bytes``
+
+        Args:
+            folder (str): Folder name, e.g. sources
+            records (list[dict]): Records to append; ids continue the folder's sequence
+            compression (str): "none", "gzip" or "zstd"; a log in another format is rolled over
+
+        Returns:
+            list[dict]: The appended records with their assigned ids
+        """
+        with self.lock:
+            entry = self.folders.setdefault(folder, {"records": 0, "files": []})
+            directory = self.directory(folder)
+            active = entry["files"][-1] if entry["files"] else None
+            if active is not None:
+                path = directory.joinpath(active["name"])
+                if path.exists() and path.stat().st_size != active["bytes"]:
+                    # An append failed part way; cut its torn tail and recount before appending
+                    self._reconcile_folder(folder, directory)
+            if (
+                active is None
+                or log_compression(active["name"]) != compression
+                or active["bytes"] >= self.segment_bytes
+            ):
+                active = {
+                    "name": f"{datetime.now().date()}-{uuid4().hex[:8]}{LOG_SUFFIXES[compression]}",
+                    "first_id": entry["records"] + 1,
+                    "records": 0,
+                    "bytes": 0,
+                }
+                entry["files"].append(active)
+            directory.mkdir(parents=True, exist_ok=True)
+            size = append_records(directory.joinpath(active["name"]), records, entry["records"] + 1)
+            active["records"] += len(records)
+            active["bytes"] += size
+            entry["records"] += len(records)
+            self._save()
+        return records
+
+    def copy(self, thread_id: str) -> None:
+        """Copy every folder of this thread, and the manifest itself, to another thread id"""
+        with self.lock:
+            for folder in self.folders:
+                directory = self.directory(folder)
+                if directory.is_dir():
+                    shutil.copytree(directory, self.root.joinpath(f"{folder}_{thread_id}"))
+            atomic_write_json(
+                self.root.joinpath(f"manifest_{thread_id}.json"), {"thread_id": thread_id, "folders": self.folders}, fsync=False
+            )
+
+    def recompress(self, folder: str, compression: str, frame_records: int = 1000) -> int:
+        """Rewrite every record file of a folder in the given compression
+
+        Records keep their ids. Each file is converted to a temp file written in frames
+        of ``frame_records``, renamed into place and recorded in the manifest before the
+        old file is removed, so a crash at any point leaves one complete copy that
+        reconciling picks up.
+
+        Returns:
+            int: Number of files converted
+        """
+        converted = 0
+        with self.lock:
+            entry = self.folders.get(folder, {"files": []})
+            directory = self.directory(folder)
+            for file in entry["files"]:
+                if log_compression(file["name"]) == compression:
+                    continue
+                source = directory.joinpath(file["name"])
+                target = directory.joinpath(f"{log_stem(file['name'])}{LOG_SUFFIXES[compression]}")
+                records = list(iter_log(source)) if log_compression(file["name"]) else json.loads(source.read_text())
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{target.name}.", suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "wb") as out:
+                        for start in range(0, len(records), frame_records):
+                            batch = records[start:start + frame_records]
+                            data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch)
+                            out.write(_encode_frame(data.encode("utf-8"), compression))
+                        out.flush()
+                        os.fsync(out.fileno())
+                    os.replace(tmp_path, target)
+                except BaseException:
+                    os.unlink(tmp_path)
+                    raise
+                file.update(name=target.name, bytes=target.stat().st_size)
+                self._save()
+                with _lock:
+                    # Nothing left to fsync once the old file is gone; sync_logs would recreate it
+                    _unsynced.pop(source, None)
+                    source.unlink()
+                converted += 1
+        return converted
+
+
+_manifests: dict[tuple[Path, str], Manifest] = {}
+
+
+def open_manifest(root: Path, thread_id: str, segment_bytes: int = 64 * 1024 * 1024) -> Manifest:
+    """Load a thread's manifest once per process"""
+    with _lock:
+        key = (root, thread_id)
+        if key not in _manifests:
+            _manifests[key] = Manifest(root, thread_id, segment_bytes)
+        return _manifests[key]
+
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """Hold an exclusive advisory lock on ``path`` across threads and processes"""
+    with path_lock(path):
+        with open(path, "a") as file:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+_path_locks: dict[Path, threading.Lock] = {}
+
+
+def path_lock(path: Path) -> threading.Lock:
+    """In-process lock for ``path``, the same object for every caller"""
+    # flock is per open file description, so threads also need an in-process lock
+    with _lock:
+        return _path_locks.setdefault(path, threading.Lock())
+
+
+def atomic_write_json(path: Path, data: Any, fsync: bool = True) -> None:
+    """Replace ``path`` with ``data`` via temp file and rename, so readers never see a partial file"""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as file:
+            json.dump(data, file)
+            if fsync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+class WriteBuffer:
+    """Write-behind buffer for research records.
+
+    Records are collected in memory and handed to ``writer`` in batches, either by a
+    background thread once ``max_records`` are pending or ``max_delay`` seconds have
+    passed, or explicitly through ``flush`` at node boundaries. Whatever is still
+    pending at interpreter exit is flushed by an ``atexit`` hook.
+    """
+
+    def __init__(self, writer: Callable[[str, str, list[dict]], None], max_records: int = 64, max_delay: float = 2.0):
+        self.writer = writer
+        self.max_records = max_records
+        self.max_delay = max_delay
+        self._pending: dict[tuple[str, str], list[dict]] = {}
+        self._size = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.RLock()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def add(self, folder: str, thread_id: str, records: list[dict]) -> None:
+        """Queue copies of records for ``folder``/``thread_id`` without touching disk"""
+        with self._cond:
+            self._pending.setdefault((folder, thread_id), []).extend(dict(record) for record in records)
+            self._size += len(records)
+            if self._size >= self.max_records:
+                self._cond.notify()
+
+    def pending(self) -> int:
+        """Number of records waiting to be written"""
+        with self._cond:
+            return self._size
+
+    def _take(self, folder: str | None, thread_id: str | None) -> list[tuple[tuple[str, str], list[dict]]]:
+        with self._cond:
+            keys = [
+                key for key in self._pending
+                if (folder is None or key[0] == folder) and (thread_id is None or key[1] == thread_id)
+            ]
+            batches = [(key, self._pending.pop(key)) for key in keys]
+            self._size -= sum(len(records) for _, records in batches)
+        return batches
+
+    def _requeue(self, batches: list[tuple[tuple[str, str], list[dict]]]) -> None:
+        with self._cond:
+            for key, records in reversed(batches):
+                self._pending[key] = records + self._pending.get(key, [])
+                self._size += len(records)
+
+    def flush(self, folder: str | None = None, thread_id: str | None = None) -> None:
+        """Write pending records, optionally only those of one folder and/or thread
+
+        Once this returns, every record queued before the call is persisted. If the
+        writer fails, the unwritten batches are put back and the error is raised.
+        """
+        with self._flush_lock:
+            batches = self._take(folder, thread_id)
+            for count, ((batch_folder, batch_thread), records) in enumerate(batches):
+                try:
+                    self.writer(batch_folder, batch_thread, records)
+                except Exception:
+                    self._requeue(batches[count:])
+                    raise
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait(timeout=self.max_delay)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Write-behind flush failed, retrying later: {e}")
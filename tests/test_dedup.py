@@ -0,0 +1,7 @@
+from dedup import normalize_url
+
+
+def test_normalize_url_drops_only_tracking_params():
+    url = "http://www.Example.com/page/?reference=3&utm_source=x&ref=feed&fbclid=1&refresh=1#top"
+
+    assert normalize_url(url) == "https://example.com/page?reference=3&refresh=1"
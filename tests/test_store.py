@@ -0,0 +1,76 @@
+import gzip
+
+from store import Manifest, iter_log
+
+
+def test_append_after_torn_gzip_frame(tmp_path):
+    manifest = Manifest(tmp_path, "t1")
+    manifest.append("sources", [{"n": 1}, {"n": 2}], "gzip")
+    log = manifest.current("sources")
+    # A crash mid-append leaves half a frame behind
+    frame = gzip.compress(b'{"n": 3}\n')
+    with open(log, "ab") as file:
+        file.write(frame[: len(frame) // 2])
+
+    reopened = Manifest(tmp_path, "t1")
+    reopened.append("sources", [{"n": 4}], "gzip")
+
+    records = list(iter_log(log))
+    assert [record["n"] for record in records] == [1, 2, 4]
+    assert [record["id"] for record in records] == [1, 2, 3]
+    assert reopened.records("sources") == 3
+
+
+def test_torn_frame_inside_log_stops_reading(tmp_path):
+    log = tmp_path.joinpath("log.jsonl.gz")
+    frame = gzip.compress(b'{"n": 2}\n')
+    log.write_bytes(gzip.compress(b'{"n": 1}\n') + frame[: len(frame) // 2] + gzip.compress(b'{"n": 3}\n'))
+
+    assert [record["n"] for record in iter_log(log)] == [1]
+
+
+def test_append_after_torn_jsonl_line(tmp_path):
+    manifest = Manifest(tmp_path, "t1")
+    manifest.append("sources", [{"n": 1}, {"n": 2}])
+    log = manifest.current("sources")
+    with open(log, "a") as file:
+        file.write('{"id": 3, "n"')
+
+    reopened = Manifest(tmp_path, "t1")
+    reopened.append("sources", [{"n": 5}])
+
+    records = list(iter_log(log))
+    assert [record["n"] for record in records] == [1, 2, 5]
+    assert [record["id"] for record in records] == [1, 2, 3]
+
+
+def test_reconcile_after_interrupted_recompress(tmp_path):
+    manifest = Manifest(tmp_path, "t1")
+    manifest.append("sources", [{"n": 1}, {"n": 2}])
+    source = manifest.current("sources")
+    original = source.read_bytes()
+    manifest.recompress("sources", "gzip")
+    target = manifest.current("sources")
+    # A crash after the rename but before the old file was removed leaves both behind
+    source.write_bytes(original)
+
+    reopened = Manifest(tmp_path, "t1")
+    assert reopened.files("sources") == [target]
+    assert reopened.records("sources") == 2
+
+    # A crash before the manifest was saved: it still names the old file, now gone
+    reopened.folders["sources"]["files"][0]["name"] = source.name
+    source.unlink()
+    reopened._save()
+
+    recovered = Manifest(tmp_path, "t1")
+    assert recovered.files("sources") == [target]
+    assert [record["n"] for record in iter_log(target)] == [1, 2]
+    assert recovered.records("sources") == 2
+
+
+def test_reconcile_ignores_other_threads_with_same_suffix(tmp_path):
+    Manifest(tmp_path, "a_b").append("notes", [{"n": 1}])
+    manifest = Manifest(tmp_path, "b")
+
+    assert manifest.folders == {}
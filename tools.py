@@ -1,13 +1,31 @@
 import os
 import json
+import shutil
+import asyncio
+import threading
 from datetime import datetime
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from uuid import uuid4
 from enum import Enum
+from typing import Callable, Iterable, Iterator
 import json
 from dotenv import find_dotenv, load_dotenv
-from tavily import TavilyClient
 from langchain_core.tools import tool
+from pydantic import ValidationError
+
+import sqlite_store
+from bm25 import BM25Index, add_documents, open_index
+from cache import DiskCache, make_key
+from dedup import SourceDeduper, dedupe_queries, open_deduper
+from passages import source_passages
+from replay import ReplayMiss, replay_store
+from search_backends import ReplayBackend, SearchBackend, get_backend
+from configration import Configration
+from schema import SearchResponse
+from vector_index import VectorIndex, get_embedder, open_vector_index
+from store import Manifest, WriteBuffer, atomic_write_json, file_lock, iter_log, log_compression, open_manifest, path_lock
 
 load_dotenv(find_dotenv())
 
@@ -20,68 +38,203 @@ class DirectoryMapping(Enum):
     STATE = "states"
     TODO = "todo"
 
-root_dir = "/mnt/d/Personal Projects/deep_agent/research"
-TAVILY_CLIENT = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+root_dir = f"{Configration.from_runnable_config().research_root()}"
+_write_buffer: WriteBuffer | None = None
+_write_buffer_lock = threading.Lock()
+_search_executor: ThreadPoolExecutor | None = None
+_search_executor_lock = threading.Lock()
+_search_cache: DiskCache | None = None
+_search_cache_lock = threading.Lock()
+_query_lock = threading.Lock()
+# Queries claimed per thread whose search has not finished yet
+_inflight_queries: dict[str, dict[str, dict]] = {}
+
+
+def directory_kind(folder: str) -> DirectoryMapping:
+    """Map a folder name used by the agents (e.g. ``question``, ``draft``) to its DirectoryMapping"""
+    for kind in DirectoryMapping:
+        if folder in (kind.value, kind.value.rstrip("s"), kind.name.lower()):
+            return kind
+    raise ValueError(f"Unknown research folder: {folder}")
+
+
+def sqlite_db() -> str | None:
+    """Path of the SQLite research database when that backend is configured, otherwise None"""
+    configurable = Configration.from_runnable_config()
+    if configurable.storage_backend != "sqlite":
+        return None
+    return configurable.sqlite_path or f"{Path(root_dir).joinpath('research.db')}"
 
-@tool
-def tavily_search(query: str) -> str:
-    """Search the web for information on a given topic.
+
+def manifest(thread_id: str) -> Manifest:
+    """The thread's manifest of research files, loaded once per process"""
+    return open_manifest(Path(root_dir), thread_id, Configration.from_runnable_config().log_segment_bytes)
+
+
+def search_backend() -> SearchBackend:
+    """The configured search backend (``search_backend``), built once per process
+
+    With ``replay_mode`` set, searches are recorded to or replayed from the replay store.
+    """
+    configurable = Configration.from_runnable_config()
+    store = replay_store()
+    if store is not None:
+        return ReplayBackend(
+            configurable.search_backend,
+            lambda: get_backend(configurable.search_backend, configurable.search_corpus_dir),
+            store,
+        )
+    return get_backend(configurable.search_backend, configurable.search_corpus_dir)
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a query, used as the cache key"""
+    return " ".join(query.lower().split())
+
+
+def search_cache() -> DiskCache | None:
+    """Shared search result cache, or None when ``search_cache`` is disabled"""
+    global _search_cache
+    configurable = Configration.from_runnable_config()
+    if not configurable.search_cache:
+        return None
+    with _search_cache_lock:
+        if _search_cache is None:
+            _search_cache = DiskCache(
+                Path(root_dir).joinpath("search_cache.db"),
+                ttl=configurable.search_cache_ttl,
+                max_entries=configurable.search_cache_size,
+            )
+    return _search_cache
+
+
+def search_cache_stats() -> dict:
+    """Hit/miss counters of the search cache for this process"""
+    cache = search_cache()
+    return cache.stats() if cache is not None else {"hits": 0, "misses": 0, "hit_rate": 0.0, "entries": 0}
+
+
+def run_search(
+    query: str,
+    search_depth: str = "advanced",
+    max_results: int = 5,
+    time_range: str = "year",
+    use_cache: bool = True,
+) -> dict:
+    """Run one search through the configured backend and return its Tavily-shaped response
+
+    Successful responses are cached on disk, keyed on the backend, normalized query,
+    depth, max_results and time_range, so repeated queries skip the round-trip.
 
     Args:
-        query: The search query string
+        query (str): The search query string
+        search_depth (str): "advanced" or "basic"
+        max_results (int): Number of results to request
+        time_range (str): Tavily time range filter
+        use_cache (bool): Set to False to bypass the cache and always hit the backend
+
+    Returns:
+        dict: Tavily-shaped response, or ``{"error": ..., "results": []}`` if the search failed
     """
+    backend = search_backend()
+    cache = search_cache() if use_cache and replay_store() is None else None
+    key = make_key(backend.name, normalize_query(query), search_depth, max_results, time_range)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return json.loads(cached)
     try:
-        results = TAVILY_CLIENT.search(
-            query=query,
-            max_results=5,
-            search_depth="advanced",
-            include_answer=True,
-            include_images=False,
-            time_range="year",
-            # No start_date or end_date
-        )
-        return json.dumps(results)  # Always return valid JSON string
+        results = backend.search(query, search_depth=search_depth, max_results=max_results, time_range=time_range)
+    except ReplayMiss:
+        raise
     except Exception as e:
-        return json.dumps({"error": str(e), "results": []})
+        print(f"[run_search] Search failed for '{query}': {e}")
+        return {"error": str(e), "results": []}
+    if cache is not None:
+        cache.set(key, json.dumps(results))
+    return results
+
+
+def _search_pool() -> ThreadPoolExecutor:
+    global _search_executor
+    with _search_executor_lock:
+        if _search_executor is None:
+            _search_executor = ThreadPoolExecutor(
+                max_workers=Configration.from_runnable_config().search_concurrency, thread_name_prefix="search"
+            )
+    return _search_executor
+
+
+async def asearch_many(queries: list[str], search_depth: str = "advanced", timeout: float | None = None) -> list[dict]:
+    """Run several searches at once on a bounded thread pool, for use from async nodes
+
+    Args:
+        queries (list[str]): Search queries
+        search_depth (str): "advanced" or "basic"
+        timeout (float | None): Seconds allowed per query, retries included, defaults to ``search_timeout``
+
+    Returns:
+        list[dict]: One response per query in the original order; a query that times out
+            gets ``{"error": ..., "results": []}``
+    """
+    timeout = timeout if timeout is not None else Configration.from_runnable_config().search_timeout
+    loop = asyncio.get_running_loop()
+
+    async def _one(query: str) -> dict:
+        try:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(_search_pool().submit(run_search, query, search_depth), loop=loop), timeout
+            )
+        except asyncio.TimeoutError:
+            return {"error": f"Search timed out after {timeout}s: {query}", "results": []}
+
+    return list(await asyncio.gather(*(_one(query) for query in queries)))
+
+
+def search_response(query: str, search_depth: str = "advanced") -> SearchResponse:
+    """``run_search`` validated into a typed SearchResponse, failures carried in ``error``"""
+    try:
+        return SearchResponse.model_validate({"query": query, **run_search(query, search_depth)})
+    except ValidationError as e:
+        # A backend payload that does not match the schema is a failed search, not a crash
+        return SearchResponse(query=query, error=str(e))
 
 
-@tool
-def tavily_search_basic(query: str) -> str:
+@tool(response_format="content_and_artifact")
+def tavily_search(query: str) -> tuple[str, SearchResponse]:
+    """Search the web for information on a given topic.
+
+    Args:
+        query: The search query string
+    """
+    # The model reads the JSON content; nodes read the typed artifact without re-parsing it
+    response = search_response(query, "advanced")
+    return response.model_dump_json(exclude_none=True), response
+
+
+@tool(response_format="content_and_artifact")
+def tavily_search_basic(query: str) -> tuple[str, SearchResponse]:
     """Search the web for basic information on a given topic.
 
     Args:
         query: The search query string
     """
-    try:
-        results = TAVILY_CLIENT.search(
-            query=query,
-            max_results=5,
-            search_depth="basic",
-            include_answer=True,
-            include_images=False,
-            time_range="year",
-        )
-        return json.dumps(results)
-    except Exception as e:
-        return json.dumps({"error": str(e), "results": []})
+    response = search_response(query, "basic")
+    return response.model_dump_json(exclude_none=True), response
 
 
 def search_tool(state, thread_id: str) -> str | None:
-    """_summary_
+    """Locate the current file of a research folder
 
     Args:
-        state (_type_): _description_
-        thread_id (str): _description_
+        state (_type_): Dict with the DirectoryMapping name under ``phase``
+        thread_id (str): thread_id is used to name file and search the file
+
+    Returns:
+        str | None: Name of the folder's current file from the thread manifest, or None
     """
-    date = datetime.now().date()
-    target_folder = f"{getattr(DirectoryMapping, state["phase"]).value}_{thread_id}"
-    directory = Path(root_dir).joinpath(target_folder)
-    if Path.is_dir(directory):
-        for file in Path(directory).glob("*.json"):
-            if file.name.startswith(f"{date}"):
-                return file.name
-    else:
-        return None
+    current = manifest(thread_id).current(getattr(DirectoryMapping, state["phase"]).value)
+    return current.name if current is not None else None
 
 
 def read_todo(thread_id: str) -> dict:
@@ -93,6 +246,10 @@ def read_todo(thread_id: str) -> dict:
     Returns:
         dict: Returns TODO which is list of task 
     """
+    db_path = sqlite_db()
+    if db_path:
+        todos = sqlite_store.select_records(db_path, "todo", thread_id)
+        return todos if todos else {"Error": "No todos found in research folder"}
     file_name = search_tool({"phase": "TODO"}, thread_id)
     if file_name != None:
         root_path = f"{Path(root_dir).joinpath(f"todo_{thread_id}")}/{file_name}"
@@ -102,7 +259,9 @@ def read_todo(thread_id: str) -> dict:
 
 def write_todo(thread_id: str, content) -> dict:
     """Create or update the todo list
-    calls search tool to locate the file if no file is found creates a todo list file
+    A list creates (or replaces) the todo list, a dict is merged into the task with the same id
+    through ``update_task``. Both go through a lock plus temp-file-and-rename, so parallel
+    branches never clobber each other or leave a half-written file.
     Args:
         thread_id (str): thread_id is used to name file and search the file
         content (dict): Data to update todo list or create todo list
@@ -110,29 +269,62 @@ def write_todo(thread_id: str, content) -> dict:
     Returns:
         dict: returns the content argument
     """
-    file_name = search_tool({"phase": "TODO"}, thread_id)
-    if file_name != None:
-        root_path = f"{Path(root_dir).joinpath(f"todo_{thread_id}")}/{file_name}"
-        with open(root_path, "r") as file:
-            todos = json.load(file)
-        for count, todo in enumerate(todos):
-            if todo["id"] == content["id"]:
-                todos[count] = content
-        with open(root_path, "w") as file:
-            json.dump(todos, file)
-        return content
-    else:
-        date = datetime.now().date()
-        Path(f"{root_dir}/todo_{thread_id}").mkdir(parents=True, exist_ok=True)
-        root_path = f"{Path(root_dir).joinpath(f"todo_{thread_id}")}/{date}-{uuid4().hex[:8]}.json"
-        with open(root_path, "w") as file:
-            json.dump(content, file)
+    db_path = sqlite_db()
+    if db_path and isinstance(content, list):
+        return sqlite_store.replace_todos(db_path, thread_id, content)
+    if not isinstance(content, list):
+        update_task(thread_id, content)
         return content
+    directory = Path(root_dir).joinpath(f"todo_{thread_id}")
+    directory.mkdir(parents=True, exist_ok=True)
+    with file_lock(directory.joinpath(".lock")):
+        todo_path = manifest(thread_id).current("todo")
+        if todo_path is None:
+            todo_path = manifest(thread_id).register("todo", f"{datetime.now().date()}-{uuid4().hex[:8]}.json", len(content))
+        atomic_write_json(todo_path, content)
+    return content
+
+
+def update_task(thread_id: str, content: dict, expected_status: str | None = None) -> bool:
+    """Atomically update a single task in the todo list
+
+    Args:
+        thread_id (str): thread_id is used to name file and search the file
+        content (dict): Fields to merge into the task, must contain ``id``
+        expected_status (str | None): Only apply the update when the task currently has this
+            status, e.g. "Not Started" to claim a task exactly once across parallel branches
+
+    Returns:
+        bool: True if the task was updated
+    """
+    db_path = sqlite_db()
+    if db_path:
+        return sqlite_store.update_todo(db_path, thread_id, content, expected_status)
+    directory = Path(root_dir).joinpath(f"todo_{thread_id}")
+    if not directory.is_dir():
+        return False
+    with file_lock(directory.joinpath(".lock")):
+        file_name = search_tool({"phase": "TODO"}, thread_id)
+        if file_name is None:
+            return False
+        todo_path = directory.joinpath(file_name)
+        todos = json.loads(todo_path.read_text())
+        for todo in todos:
+            if todo["id"] == content["id"]:
+                if expected_status is not None and todo.get("status") != expected_status:
+                    return False
+                todo.update(content)
+                atomic_write_json(todo_path, todos)
+                return True
+    return False
         
 
 def read_file(folder: str, thread_id: str, filename = None) -> list:
     """Read file function reads specific file if filename provided or read entire folder
 
+    Thin wrapper collecting ``iter_records`` into a list; prefer ``iter_records`` when
+    only some fields or records are needed.
+
     Args:
         folder (str): Name of the folder where file is located
         thread_id (str): thread_id is used to name file and search the file
@@ -141,76 +333,237 @@ def read_file(folder: str, thread_id: str, filename = None) -> list:
     Returns:
         dict: return contains of the folder or content of folder in key value pair with filename as key 
     """
-    if filename != None:
-        target_file = Path(root_dir).joinpath(f"{folder}_{thread_id}/{filename}")
-        with open(target_file, "r") as file:
-            data = json.load(file)
-            return data
-    else:
-        datas = []
-        target_folder = Path(root_dir).joinpath(f"{folder}_{thread_id}")
-        for files in Path(target_folder).glob("*.json"):
-            data = json.loads(files.read_text())
-            datas.extend(data)
-        return datas
-
-def edit_file(content: dict, filename: Path):
-    data = json.loads(filename.read_text())
-    id = len(data) + 1
-    content["id"] = id
-    data.append(content)
-    with open(filename, "w") as file:
-        json.dump(data, file)
+    return list(iter_records(folder, thread_id, filename=filename))
 
-def write_file(folder: str, thread_id: str, contents: list[dict]) -> list[dict]:
-    date = datetime.now().date()
-    root_path = f"{Path(root_dir).joinpath(f"{folder}_{thread_id}")}"
-    Path(root_path).mkdir(parents=True, exist_ok=True)
-    for file in Path(root_path).glob("*.json"):
-        filename = "-".join(file.name.split("-")[:-1])
-        if filename == f"{date}":
-            for content in contents:
-                edit_file(content, file)
-            return contents
-    with open(f"{root_path}/{date}-{uuid4().hex[:8]}.json", "w") as file:
-        json.dump(contents, file)
-    return contents
 
+def iter_records(
+    folder: str,
+    thread_id: str,
+    fields: Iterable[str] | None = None,
+    where: Callable[[dict], bool] | None = None,
+    limit: int | None = None,
+    filename: str | None = None,
+) -> Iterator[dict]:
+    """Lazily stream the records of a research folder
 
+    Records are yielded one at a time from the folder's JSONL logs (or SQLite pages),
+    so memory stays flat however large the folder grows. Legacy ``*.json`` array files
+    written before the append-only store are still read. Records still sitting in the
+    write-behind buffer for this folder are flushed first.
 
+    Args:
+        folder (str): Name of the folder, e.g. sources, notes, draft, question
+        thread_id (str): thread_id is used to name file and search the file
+        fields (Iterable[str] | None): Only keep these keys of each record, e.g. ("id", "url", "content")
+        where (Callable[[dict], bool] | None): Only yield records for which this returns True
+        limit (int | None): Stop after this many records
+        filename (str | None): Only read this file of the folder (file backend)
 
+    Yields:
+        dict: Records in the order they were written
+    """
+    flush_writes(folder, thread_id)
+    records = _iter_stored(folder, thread_id, filename)
+    if where is not None:
+        records = filter(where, records)
+    if fields is not None:
+        fields = tuple(fields)
+        records = ({key: record[key] for key in fields if key in record} for record in records)
+    yield from islice(records, limit)
+
+
+def _iter_stored(folder: str, thread_id: str, filename = None) -> Iterator[dict]:
+    """Stream records already persisted by the configured storage backend"""
+    if directory_kind(folder) is DirectoryMapping.SOURCE and filename is None:
+        deduper = source_deduper(folder, thread_id)
+        return (deduper.with_queries(record) for record in _iter_backend(folder, thread_id))
+    return _iter_backend(folder, thread_id, filename)
+
+
+def _iter_backend(folder: str, thread_id: str, filename = None) -> Iterator[dict]:
+    db_path = sqlite_db()
+    if db_path:
+        yield from sqlite_store.iter_records(db_path, directory_kind(folder).value, thread_id)
+        return
+    if filename != None:
+        files = [Path(root_dir).joinpath(f"{folder}_{thread_id}", filename)]
+    else:
+        files = manifest(thread_id).files(folder)
+    for file in files:
+        if log_compression(file.name) is not None:
+            yield from iter_log(file)
+        else:
+            yield from json.loads(file.read_text())
 
 
+def write_buffer() -> WriteBuffer | None:
+    """Shared write-behind buffer, or None when ``write_buffer_size`` is 0"""
+    global _write_buffer
+    configurable = Configration.from_runnable_config()
+    if configurable.write_buffer_size <= 0:
+        return None
+    with _write_buffer_lock:
+        if _write_buffer is None:
+            _write_buffer = WriteBuffer(
+                _persist_records, configurable.write_buffer_size, configurable.write_buffer_interval
+            )
+    return _write_buffer
 
 
+def flush_writes(folder: str | None = None, thread_id: str | None = None) -> None:
+    """Persist buffered records, optionally only those of one folder and/or thread
 
+    Nodes call this at checkpoints so everything written so far is durable.
+    """
+    if _write_buffer is not None:
+        _write_buffer.flush(folder, thread_id)
 
 
+def write_file(folder: str, thread_id: str, contents: list[dict]) -> list[dict]:
+    """Append records to the folder's active log
 
+    Records go to an append-only ``{date}-{hex}.jsonl`` log located through the thread
+    manifest, so each call costs only the bytes being written regardless of how much
+    the folder already holds, and no directory is scanned.
+    With the write-behind buffer enabled the records are only queued here and
+    written in batches off the calling node's path.
 
+    Args:
+        folder (str): Name of the folder, e.g. sources, notes, draft, question
+        thread_id (str): thread_id is used to name file and search the file
+        contents (list[dict]): Records to store; ids continue the folder's sequence
 
+    Returns:
+        list[dict]: returns the contents argument
+    """
+    buffer = write_buffer()
+    if buffer is not None:
+        buffer.add(folder, thread_id, contents)
+        return contents
+    return _persist_records(folder, thread_id, contents)
+
+
+def _persist_records(folder: str, thread_id: str, contents: list[dict]) -> list[dict]:
+    """Write records through the configured storage backend, deduplicating and indexing new sources"""
+    if directory_kind(folder) is not DirectoryMapping.SOURCE:
+        return _store_records(folder, thread_id, contents)
+    stored = source_deduper(folder, thread_id).ingest(
+        contents, lambda records: _store_records(folder, thread_id, records)
+    )
+    keyword_index(folder, thread_id, new_records=stored)
+    try:
+        passage_index(folder, thread_id, stored)
+    except Exception as e:
+        print(f"[write_file] Could not embed {len(stored)} sources for the passage index: {e}")
+    return contents
 
 
+def _store_records(folder: str, thread_id: str, contents: list[dict]) -> list[dict]:
+    """Append records to the SQLite table or the folder's active JSONL log"""
+    db_path = sqlite_db()
+    if db_path:
+        return sqlite_store.insert_records(db_path, directory_kind(folder).value, thread_id, contents)
+    return manifest(thread_id).append(folder, contents, Configration.from_runnable_config().storage_compression)
 
 
+def source_deduper(folder: str, thread_id: str) -> SourceDeduper:
+    """Open the thread's source deduplication state, seeding it from stored sources the first time"""
+    path = Path(root_dir).joinpath(f"{folder}_{thread_id}.dedup.jsonl")
+    seed = not path.exists()
+    deduper = open_deduper(path)
+    if seed:
+        deduper.seed(list(_iter_backend(folder, thread_id)))
+    return deduper
 
 
+def index_path(folder: str, thread_id: str) -> Path:
+    """BM25 index file over the content of a source folder, kept next to the folder"""
+    return Path(root_dir).joinpath(f"{folder}_{thread_id}.content.bm25.jsonl")
 
 
+def _index_documents(records: Iterable[dict], key: str) -> list[tuple[str, dict]]:
+    """Turn records into ``(text, meta)`` pairs for the keyword index"""
+    return [
+        (
+            f"{record.get('title') or ''} {record[key]}",
+            # The text itself stays in the research store; hits are resolved by id
+            {"id": record.get("id"), "url": record.get("url"), "title": record.get("title")},
+        )
+        for record in records
+        if isinstance(record.get(key), str) and record[key]
+    ]
+
 
+def keyword_index(folder: str, thread_id: str, new_records: list[dict] | None = None) -> BM25Index:
+    """Open the BM25 index over a source folder's content, building it from stored records the first time
 
+    Only this index is persisted: ``_persist_records`` adds every new source to it, so it
+    never goes stale. As in ``passage_index``, the check, the build and the adding of
+    ``new_records`` run under the index's lock, so no record is indexed twice.
+    """
+    path = index_path(folder, thread_id)
+    with path_lock(path):
+        if not path.exists():
+            return add_documents(path, _index_documents(_iter_stored(folder, thread_id), "content"))
+        if new_records:
+            return add_documents(path, _index_documents(new_records, "content"))
+        return open_index(path)
 
 
 
 
+def passage_index_path(folder: str, thread_id: str) -> Path:
+    """Passage vector index file of the configured embedder, kept next to the research folder"""
+    configurable = Configration.from_runnable_config()
+    embedder = get_embedder(configurable.embedding_backend, configurable.embedding_model, configurable.llm_keep_alive)
+    return Path(root_dir).joinpath(f"{folder}_{thread_id}.{embedder.name}.vectors.jsonl")
 
 
+def passage_index(folder: str, thread_id: str, new_records: list[dict] | None = None) -> VectorIndex:
+    """Open the folder's passage vector index, building it from stored records the first time
 
+    The check, the build and the adding of ``new_records`` (records just stored) all run
+    under the index's lock, so sections searching concurrently embed the corpus only once.
+    A build reads every stored record, so it already covers ``new_records``.
+    """
+    configurable = Configration.from_runnable_config()
+    embedder = get_embedder(configurable.embedding_backend, configurable.embedding_model, configurable.llm_keep_alive)
+    path = passage_index_path(folder, thread_id)
+    with path_lock(path):
+        index = open_vector_index(path, embedder)
+        if not len(index):
+            _index_passages(index, _iter_stored(folder, thread_id))
+        elif new_records:
+            _index_passages(index, new_records)
+    return index
 
 
+def _index_passages(index: VectorIndex, records: Iterable[dict]) -> None:
+    """Chunk records into passages and add them to a vector index"""
+    passages = source_passages(records, Configration.from_runnable_config().passage_words)
+    index.add([f"{passage['title'] or ''} {passage['text']}" for passage in passages], passages)
 
 
+def search_passages(thread_id: str, query: str, top_k: int = 8) -> list[dict]:
+    """Top-k source passages for a query by embedding similarity
 
+    Args:
+        thread_id (str): thread whose sources are searched
+        query (str): Free-text query, e.g. a section heading and its brief
+        top_k (int): Number of passages to return
+
+    Returns:
+        list[dict]: Passages (``source_id``, ``url``, ``title``, ``text``) with a positive ``score``, best first;
+            empty when the embedder fails, so callers fall back to the summarized sources
+    """
+    flush_writes("sources", thread_id)
+    try:
+        index = passage_index("sources", thread_id)
+        results = index.search(query, top_k)
+    except Exception as e:
+        print(f"[search_passages] Passage search failed for '{query[:80]}': {e}")
+        return []
+    return [{**meta, "score": score} for score, meta in results if score > 0]
 
 
 def write_json_tool(state, content, thread_id: str, filename=None):
@@ -288,35 +641,199 @@ def edit_json_tool(state, content, thread_id: str, filename: None | str):
             with open(file_path, "w") as file:
                 json.dump(datas, file, indent=2)
 
-def search_file_with_keyword(state, query, key, thread_id: str, filename = None | str):
-    """This is used for keyword searching in  file to retrive related information
+def search_file_with_keyword(state, query, key, thread_id: str, filename = None, top_k: int = 5) -> list[dict]:
+    """Rank records of a research folder against a query with BM25
 
     Args:
         state (_type_): LLM agent states where we can check what kind of task we are working on
         query (_type_): question or query that needs to be searched
         key (_type_): which key is it stored on in file since everything is in json
-        filename (str | None): if filename is provided it will just search and return content from that file
+        filename (str | None): if filename is provided only records from that file are ranked
+        top_k (int): Number of records to return
 
     Returns:
-        _type_: None or List of file path
+        list[dict]: Best matching records (id, url, title and ``key``) with their ``score``, best first
     """
-    target_folder = f"{getattr(DirectoryMapping, state["phase"]).value}_{thread_id}"
-    directory = Path(root_dir).joinpath(target_folder)
-    results = []
-    if Path.is_dir(directory):
-        if filename:
-            file_path = Path(directory).joinpath(filename)
-            data = json.loads(Path.read_text(file_path))
-            if query.lower() in data[key].lower():
-                results.append(file_path)
-                return results
-        else:
-            for file in Path(directory).glob("*.json"):
-                data = json.loads(file.read_text())
-                if query.lower() in data["claim"].lower():
-                    results.append(file)
-            return results
-    else:
-        return None
+    folder = getattr(DirectoryMapping, state["phase"]).value
+    flush_writes(folder, thread_id)
+    if filename is None and directory_kind(folder) is DirectoryMapping.SOURCE and key == "content":
+        hits = keyword_index(folder, thread_id).search(query, top_k)
+        records = records_by_id(folder, thread_id, [meta.get("id") for _, meta in hits])
+        return [{**meta, key: records.get(meta.get("id"), {}).get(key), "score": score} for score, meta in hits]
+    # Only the sources' content index is persisted; other folders, keys or single files are ranked from a scan
+    index = BM25Index()
+    for record in _iter_stored(folder, thread_id, filename):
+        for text, meta in _index_documents([record], key):
+            index.add(text, {**meta, key: record[key]})
+    return [{**meta, "score": score} for score, meta in index.search(query, top_k)]
+
+
+def records_by_id(folder: str, thread_id: str, ids: Iterable[int]) -> dict[int, dict]:
+    """Stored records of a folder with the given ids, read without scanning the whole folder
+
+    SQLite looks each id up through its index. The file store reads only the logs whose
+    id range in the manifest holds a wanted id, and stops once it has them all. Ids not
+    where the manifest puts them (legacy files) are looked for in a full scan.
+
+    Args:
+        folder (str): Name of the folder, e.g. sources
+        thread_id (str): thread the records belong to
+        ids (Iterable[int]): Record ids, e.g. of keyword index hits
 
-# write_file("todo", "quantum", [{"some": "new"}])
\ No newline at end of file
+    Returns:
+        dict[int, dict]: Records by id; ids that were not found are left out
+    """
+    wanted = {record_id for record_id in ids if isinstance(record_id, int)}
+    found: dict[int, dict] = {}
+    db_path = sqlite_db()
+    if db_path:
+        for record_id in wanted:
+            for record in sqlite_store.select_records(db_path, directory_kind(folder).value, thread_id, where={"id": record_id}):
+                found[record_id] = record
+        return found
+    files: dict[Path, set[int]] = {}
+    for record_id in wanted:
+        path = manifest(thread_id).locate(folder, record_id)
+        if path is not None:
+            files.setdefault(path, set()).add(record_id)
+    for path, file_ids in files.items():
+        records = iter_log(path) if log_compression(path.name) is not None else json.loads(path.read_text())
+        for record in records:
+            if record.get("id") in file_ids:
+                found[record["id"]] = record
+                if file_ids <= found.keys():
+                    break
+    missing = wanted - found.keys()
+    if missing:
+        for record in _iter_backend(folder, thread_id):
+            if record.get("id") in missing:
+                found[record["id"]] = record
+    return found
+
+
+def search_sources(thread_id: str, query: str, top_k: int = 5) -> list[dict]:
+    """Top-k collected sources for a query, ranked by BM25 over title and content"""
+    return search_file_with_keyword({"phase": "SOURCE"}, query, "content", thread_id, top_k=top_k)
+
+
+def claim_queries(thread_id: str, questions: list[dict], threshold: float | None = None) -> list[dict]:
+    """Keep only the follow-up queries that have not been searched yet and claim them
+
+    A query is dropped when it near-duplicates another one of the batch, a query already
+    stored in the thread's question folder or one claimed by a search still running.
+    Claims are held in memory under a lock, so concurrent callers never both claim the
+    same query; ``finish_query`` releases a claim once its search is done.
+
+    Args:
+        thread_id (str): thread the queries belong to
+        questions (list[dict]): Candidate question records with a ``query`` key
+        threshold (float | None): Similarity marking a duplicate, defaults to ``query_similarity``
+
+    Returns:
+        list[dict]: The questions to dispatch, in their original order
+    """
+    if threshold is None:
+        threshold = Configration.from_runnable_config().query_similarity
+    with _query_lock:
+        inflight = _inflight_queries.setdefault(thread_id, {})
+        history = [record["query"] for record in iter_records("question", thread_id, fields=("query",)) if "query" in record]
+        history += list(inflight)
+        kept = [questions[position] for position in dedupe_queries([q["query"] for q in questions], history, threshold)]
+        if len(kept) < len(questions):
+            print(f"[claim_queries] Skipped {len(questions) - len(kept)} duplicate queries of {len(questions)}")
+        for question in kept:
+            inflight[question["query"]] = question
+    return kept
+
+
+def finish_query(thread_id: str, query: str, succeeded: bool) -> None:
+    """Release the claim on a query, recording it as searched only if its search succeeded
+
+    A failed search (error, timeout, open circuit breaker) is not recorded, so the query
+    can be claimed again later in the run or after ``--resume``.
+
+    Args:
+        thread_id (str): thread the query belongs to
+        query (str): Query text as claimed
+        succeeded (bool): Whether the search returned results without an error
+    """
+    with _query_lock:
+        question = _inflight_queries.get(thread_id, {}).pop(query, None)
+        if succeeded:
+            write_file("question", thread_id, [question or {"query": query}])
+
+
+def copy_thread(thread_id: str, new_thread_id: str) -> None:
+    """Copy a thread's stored research and its source indexes to a new thread id
+
+    Used to run the writer repeatedly on identical inputs: each run gets its own copy,
+    so nothing one run writes changes what the next one reads.
+    """
+    flush_writes(thread_id=thread_id)
+    db_path = sqlite_db()
+    if db_path:
+        sqlite_store.copy_thread(db_path, thread_id, new_thread_id)
+    manifest(thread_id).copy(new_thread_id)
+    folder = DirectoryMapping.SOURCE.value
+    vectors = passage_index_path(folder, thread_id)
+    sidecars = [
+        Path(root_dir).joinpath(f"{folder}_{thread_id}.dedup.jsonl"),
+        index_path(folder, thread_id),
+        vectors,
+        vectors.with_name(vectors.name + ".f32"),
+    ]
+    for path in sidecars:
+        if path.exists():
+            shutil.copyfile(path, path.with_name(path.name.replace(f"{folder}_{thread_id}.", f"{folder}_{new_thread_id}.", 1)))
+
+
+def stored_thread_ids() -> list[str]:
+    """Ids of every thread with a research folder under ``root_dir``, with or without a manifest"""
+    thread_ids = set()
+    for directory in Path(root_dir).glob("*_*"):
+        folder, _, tid = directory.name.partition("_")
+        if not directory.is_dir():
+            continue
+        try:
+            directory_kind(folder)
+        except ValueError:
+            continue
+        thread_ids.add(tid)
+    return sorted(thread_ids)
+
+
+def migrate_compression(compression: str, thread_id: str | None = None) -> int:
+    """Convert stored research folders to another compression
+
+    Args:
+        compression (str): "none", "gzip" or "zstd"
+        thread_id (str | None): Only convert this thread, defaults to every thread under ``root_dir``
+
+    Returns:
+        int: Number of files converted
+    """
+    flush_writes(thread_id=thread_id)
+    converted = 0
+    for tid in ([thread_id] if thread_id is not None else stored_thread_ids()):
+        thread_manifest = manifest(tid)
+        for folder in list(thread_manifest.folders):
+            if folder != "todo":  # the todo list is rewritten in place, not appended
+                converted += thread_manifest.recompress(folder, compression)
+    return converted
+
+# write_file("todo", "quantum", [{"some": "new"}])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Research store maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate = commands.add_parser("migrate", help="Convert stored research folders to another compression")
+    migrate.add_argument("--compression", choices=["none", "gzip", "zstd"], required=True)
+    migrate.add_argument("--thread-id", default=None, help="Only convert this thread")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        count = migrate_compression(args.compression, args.thread_id)
+        print(f"Converted {count} files to {args.compression}")
\ No newline at end of file
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from typing import Any, Dict, List
 from langchain_core.messages import AnyMessage, AIMessage, HumanMessage, BaseMessage
 import tiktoken
@@ -30,7 +31,16 @@ class TokenManger:
         try:
             self.encoding = tiktoken.encoding_for_model(model)
         except KeyError:
-            self.encoding = tiktoken.get_encoding("cl100k_base")
+            try:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                # Encoding files could not be downloaded (offline run): estimate instead
+                self.encoding = None
+            
+    def _length(self, text: str) -> int:
+        if self.encoding is None:
+            return len(text) // 4 + 1
+        return len(self.encoding.encode(text))
             
     def count_token(self, messages: List[BaseMessage]) -> int:
         """Count total tokens in messages"""
@@ -41,11 +51,11 @@ class TokenManger:
             
             # Content
             if hasattr(message, 'content') and message.content:
-                num_tokens += len(self.encoding.encode(str(message.content)))
+                num_tokens += self._length(str(message.content))
             
             # Name - FIX: Check if it exists AND is not None
             if hasattr(message, 'name') and message.name is not None:
-                num_tokens += len(self.encoding.encode(str(message.name)))  # ✅ Convert to string
+                num_tokens += self._length(str(message.name))  # ✅ Convert to string
         
         num_tokens += 2
         return num_tokens
@@ -53,7 +63,7 @@ class TokenManger:
 
     def count_string_tokens(self, text: str) -> int:
         """Count token in  a string"""
-        return len(self.encoding.encode(text))
+        return self._length(text)
     
     def should_summarize(self, messages: List[BaseMessage]) -> bool:
         """Check if message exceed token limit"""
@@ -77,4 +87,10 @@ class TokenManger:
                 current_tokens += msg_tokens
         to_summarize = messages[:len(messages)-len(to_keep)]
             
-        return to_summarize, to_keep
\ No newline at end of file
+        return to_summarize, to_keep
+
+
+@lru_cache(maxsize=None)
+def get_token_manager(model: str) -> TokenManger:
+    """Shared TokenManger per model, so the encoding is loaded once"""
+    return TokenManger(model)
@@ -0,0 +1,162 @@
+import re
+import json
+import zlib
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from bm25 import tokenize
+
+# Buckets of the hashing embedder; collisions are rare at this size for passage vocabularies
+HASH_DIM = 1 << 12
+
+_lock = threading.RLock()
+_indexes: dict[Path, "VectorIndex"] = {}
+
+
+class HashingEmbedder:
+    """Dependency-free embeddings: signed feature hashing of unigrams and bigrams.
+
+    Captures lexical overlap only, but needs no model, is deterministic across processes
+    and embeds thousands of passages per second.
+    """
+
+    def __init__(self, dim: int = HASH_DIM):
+        self.dim = dim
+        self.name = f"hashing{dim}"
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            for feature in tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]:
+                bucket = zlib.crc32(feature.encode("utf-8"))
+                matrix[row, bucket % self.dim] += 1.0 if bucket & 0x80000000 else -1.0
+        # Damp repeated terms so long passages are not dominated by a few words
+        return normalize(np.sign(matrix) * np.log1p(np.abs(matrix)))
+
+
+class OllamaEmbedder:
+    """Embeddings from a local Ollama embedding model, e.g. nomic-embed-text"""
+
+    def __init__(self, model: str, keep_alive: str | None = None):
+        from langchain_ollama import OllamaEmbeddings
+
+        self.model = OllamaEmbeddings(model=model, keep_alive=_seconds(keep_alive) if keep_alive is not None else None)
+        self.name = f"ollama-{model.replace(':', '-').replace('/', '-')}"
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        return normalize(np.asarray(self.model.embed_documents(texts), dtype=np.float32))
+
+
+def _seconds(duration: str) -> int:
+    """Ollama duration such as "30m", "2h" or "-1" in whole seconds; OllamaEmbeddings only takes an int"""
+    match = re.fullmatch(r"\s*(-?\d+(?:\.\d+)?)\s*([smh]?)\s*", str(duration))
+    if match is None:
+        raise ValueError(f"Invalid keep-alive duration '{duration}', expected e.g. 30m, 2h or -1")
+    return int(float(match.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600}[match.group(2)])
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length so a dot product is the cosine similarity"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+class VectorIndex:
+    """Append-only vector index searched by brute-force cosine similarity.
+
+    Vectors are appended as raw float32 rows to ``<path>.f32`` and their metadata as
+    JSON lines to ``<path>``, whose first line records the embedder and dimension.
+    Adding passages never rewrites what is already stored.
+    """
+
+    def __init__(self, path: Path, embedder):
+        self.path = path
+        self.vectors_path = path.with_name(path.name + ".f32")
+        self.embedder = embedder
+        self.metas: list[dict] = []
+        self.dim: int | None = None
+        self._chunks: list[np.ndarray] = []
+        self._matrix: np.ndarray | None = None
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as file:
+                header = json.loads(file.readline() or "{}")
+                self.metas = [json.loads(line) for line in file if line.strip()]
+            self.dim = header.get("dim")
+            if self.dim:
+                vectors = np.fromfile(self.vectors_path, dtype=np.float32) if self.vectors_path.exists() else np.zeros(0, np.float32)
+                rows = min(len(self.metas), vectors.size // self.dim)
+                # A crash between the two appends leaves one file longer; keep what both have
+                self.metas = self.metas[:rows]
+                self._chunks = [vectors[:rows * self.dim].reshape(rows, self.dim)]
+
+    def __len__(self) -> int:
+        return len(self.metas)
+
+    def add(self, texts: list[str], metas: list[dict]) -> None:
+        """Embed and append passages
+
+        Args:
+            texts (list[str]): Text embedded for each passage
+            metas (list[dict]): Returned as-is when the passage matches a query
+        """
+        if not texts:
+            return
+        vectors = self.embedder.embed(texts)
+        with _lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with open(self.path, "w", encoding="utf-8") as file:
+                    file.write(json.dumps({"embedder": self.embedder.name, "dim": self.dim}) + "\n")
+            with open(self.vectors_path, "ab") as file:
+                file.write(vectors.tobytes())
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write("".join(json.dumps(meta, ensure_ascii=False) + "\n" for meta in metas))
+            self.metas += metas
+            self._chunks.append(vectors)
+            self._matrix = None
+
+    def search(self, query: str, top_k: int = 5) -> list[tuple[float, dict]]:
+        """Passages closest to a query
+
+        Args:
+            query (str): Free-text query
+            top_k (int): Number of results to return
+
+        Returns:
+            list[tuple[float, dict]]: (cosine similarity, meta) pairs, best first
+        """
+        with _lock:
+            if not self.metas:
+                return []
+            if self._matrix is None:
+                self._matrix = np.concatenate(self._chunks) if len(self._chunks) > 1 else self._chunks[0]
+                self._chunks = [self._matrix]
+            matrix, metas = self._matrix, self.metas
+        scores = matrix @ self.embedder.embed([query])[0]
+        top_k = min(top_k, len(metas))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return [(float(scores[row]), metas[row]) for row in best]
+
+
+@lru_cache(maxsize=None)
+def get_embedder(backend: str, model: str, keep_alive: str | None = None):
+    """Embedder by name, built once per process: "hashing" or "ollama" (using ``model``, kept loaded for ``keep_alive``)"""
+    if backend == "ollama":
+        return OllamaEmbedder(model, keep_alive)
+    if backend == "hashing":
+        return HashingEmbedder()
+    raise ValueError(f"Unknown embedding backend '{backend}', expected 'hashing' or 'ollama'")
+
+
+def open_vector_index(path: Path, embedder) -> VectorIndex:
+    """Load a vector index once per process and keep it in memory"""
+    with _lock:
+        if path not in _indexes:
+            _indexes[path] = VectorIndex(path, embedder)
+        return _indexes[path]
@@ -1,7 +1,7 @@
 import os
 import json
+import asyncio
 import operator
-from functools import lru_cache
 import re
 from datetime import datetime
 from pathlib import Path
@@ -10,11 +10,16 @@ from typing import TypedDict, Annotated
 from langchain.messages import AIMessage, HumanMessage, SystemMessage
 from langgraph.graph import START, END, StateGraph
 from langchain_core.runnables import RunnableConfig
-from langchain_ollama import ChatOllama
 from langgraph.types import Send
 
-from tools import read_file, tavily_search, root_dir
+from tools import asearch_many, iter_records, read_file, search_passages, search_sources, root_dir
+from cache import make_key, summary_cache
+from dedup import dedupe_queries
+from mapreduce import map_reduce
+from passages import format_passages, select_passages, source_passages
 from configration import Configration
+from llm import ainvoke, get_llm, warm_up
+from utils import get_token_manager
 from schema import Topics, QualityCheck, FollowQuestion
 from prompt import (
     topic_generator,
@@ -34,6 +39,8 @@ class SectionState(TypedDict, total=False):
     """Per-section state used inside the section subgraph."""
 
     heading: str
+    brief: str
+    passages: str
     sources: str
     notes: str
     draft: str
@@ -58,40 +65,66 @@ class State(TypedDict, total=False):
 
 
 
-@lru_cache(maxsize=None)
-def get_llm(model: str = "llama3.2:latest", temperature: float = 0.7) -> ChatOllama:
-    return ChatOllama(model=model, temperature=temperature)
 
 
 
-def read_sources(state: State, config: RunnableConfig):
-    """Read and summarize sources, notes, and draft from research files."""
+async def summarize(records: list, config: RunnableConfig) -> str:
+    """Summarize research records with a map-reduce over token-sized chunks
+
+    Records under ``summary_min_tokens`` in total are passed through as-is. Otherwise they
+    are packed in order into chunks of ``summary_chunk_tokens``, summarized in parallel
+    and reduced hierarchically. Chunk summaries are cached by chunk hash, so a rerun after
+    new records were added only summarizes the chunks that changed.
+    """
 
     configurable = Configration.from_runnable_config(config)
-    llm = get_llm(temperature=1)
+    count_tokens = get_token_manager(configurable.query_generation_model).count_string_tokens
+    texts = [f"{record}" for record in records]
+    if count_tokens(f"{records}") < configurable.summary_min_tokens:
+        return f"{records}"
+    # Chunk summaries have their own cache; keep them out of the LLM response cache
+    llm = get_llm(temperature=1, cache=False)
+    cache = summary_cache()
+
+    async def summarize_chunk(chunk: str) -> str:
+        key = make_key("summary", llm.model, summarizer, chunk)
+        cached = await asyncio.to_thread(cache.get, key) if cache is not None else None
+        if cached is not None:
+            return cached
+        response = await ainvoke(llm, [SystemMessage(content=summarizer), HumanMessage(content=chunk)])
+        if cache is not None:
+            await asyncio.to_thread(cache.set, key, response.content)
+        return response.content
+
+    return await map_reduce(texts, summarize_chunk, configurable.summary_chunk_tokens, count_tokens)
+
+
+async def summarize_sources(state: State, config: RunnableConfig):
+    """Read and summarize the stored sources."""
 
-    all_sources = read_file("sources", thread_id)
-    all_notes = read_file("notes", thread_id)
-    all_draft = read_file("draft", thread_id)
+    configurable = Configration.from_runnable_config(config)
+    # Only the fields the summarizer needs; raw_content, scores etc. are never loaded into the prompt
+    all_sources = await asyncio.to_thread(lambda: list(
+        iter_records("sources", thread_id, fields=("id", "url", "title", "content"), limit=configurable.max_source_records)
+    ))
+    return {"sources": await summarize(all_sources, config)}
 
-    all_sources = llm.invoke(
-        [SystemMessage(content=summarizer), HumanMessage(content=f"{all_sources}")]
-    )
-    all_notes = llm.invoke(
-        [SystemMessage(content=summarizer), HumanMessage(content=f"{all_notes}")]
-    )
-    all_draft = llm.invoke(
-        [SystemMessage(content=summarizer), HumanMessage(content=f"{all_draft}")]
-    )
 
-    return {
-        "sources": all_sources.content,
-        "notes": all_notes.content,
-        "draft": all_draft.content,
-    }
+async def summarize_notes(state: State, config: RunnableConfig):
+    """Read and summarize the research notes."""
+
+    all_notes = await asyncio.to_thread(read_file, "notes", thread_id)
+    return {"notes": await summarize(all_notes, config)}
+
+
+async def summarize_draft(state: State, config: RunnableConfig):
+    """Read and summarize the section drafts."""
 
+    all_draft = await asyncio.to_thread(read_file, "draft", thread_id)
+    return {"draft": await summarize(all_draft, config)}
 
-def heading_generator(state: State, config: RunnableConfig):
+
+async def heading_generator(state: State, config: RunnableConfig):
     """Generate IEEE report topic headings from summarized research."""
 
     content = f"All Research Source: {state['sources']}\n\n"
@@ -102,7 +135,7 @@ def heading_generator(state: State, config: RunnableConfig):
     structured_llm = llm.with_structured_output(Topics)
     prompt = [SystemMessage(content=topic_generator), HumanMessage(content=content)]
 
-    topic = structured_llm.invoke(prompt)
+    topic = await ainvoke(structured_llm, prompt)
     print(f"[heading_generator] Generated {len(topic.report)} topics")
     return {"topic": [t.model_dump() for t in topic.report]}
 
@@ -115,6 +148,7 @@ def process_topic(state: State):
             "section_pipeline",
             {
                 "heading": topic["topic"],
+                "brief": topic.get("brief", ""),
                 "sources": state["sources"],
                 "notes": state["notes"],
                 "draft": state["draft"],
@@ -174,7 +208,7 @@ def _renumber_content(content: str, section_num: int) -> str:
     return content
 
 
-def collect_sections(state: State):
+async def collect_sections(state: State):
     """Collect all parallel section results, format with TOC + headings, and write to file."""
 
     sections = state.get("sections", [])
@@ -218,7 +252,7 @@ def collect_sections(state: State):
     section_summaries = "\n".join(
         f"- {s['heading']}: {s['content'][:300]}..." for s in sorted_sections
     )
-    abstract_resp = llm.invoke([
+    abstract_resp = await ainvoke(llm, [
         SystemMessage(
             content=(
                 "Write a concise 150-250 word academic abstract summarizing the "
@@ -280,15 +314,31 @@ def collect_sections(state: State):
     return {"final_report": final_report}
 
 
-def generate_section(state: SectionState):
+async def generate_section(state: SectionState, config: RunnableConfig):
     """
     Generate a report section (500-2000 words) for the given heading.
-    Uses summarized sources, notes, and draft as context.
+    Uses the source passages retrieved for the heading (by embedding similarity, else
+    by BM25 over the keyword index), plus summarized notes and draft, as context.
     """
 
+    configurable = Configration.from_runnable_config(config)
     llm = get_llm(temperature=0.7)
 
-    context = f"## Research Sources Summary:\n{state['sources']}\n\n"
+    # Ground each section in the passages closest to its own heading and brief
+    query = f"{state['heading']} {state.get('brief', '')}"
+    selected = await asyncio.to_thread(search_passages, thread_id, query, configurable.section_passages)
+    if not selected:
+        # No embedding match (or the embedder is down): rank whole sources by keywords instead
+        sources = await asyncio.to_thread(search_sources, thread_id, query, configurable.section_passages)
+        count_tokens = get_token_manager(configurable.query_generation_model).count_string_tokens
+        selected = select_passages(
+            source_passages(sources, configurable.passage_words), query, configurable.context_token_budget, count_tokens
+        )
+    passages = format_passages(selected)
+    if passages:
+        context = f"## Research Sources:\n{passages}\n\n"
+    else:
+        context = f"## Research Sources Summary:\n{state['sources']}\n\n"
     context += f"## Research Notes Summary:\n{state['notes']}\n\n"
     context += f"## Draft Summary:\n{state['draft']}\n\n"
 
@@ -307,12 +357,12 @@ def generate_section(state: SectionState):
         ),
     ]
 
-    response = llm.invoke(prompt)
+    response = await ainvoke(llm, prompt)
     print(f"[generate_section] Wrote section: {state['heading']}")
-    return {"section_content": response.content}
+    return {"section_content": response.content, "passages": passages}
 
 
-def check_quality(state: SectionState):
+async def check_quality(state: SectionState):
     """
     Evaluate the quality of a generated section.
     Returns pass/fail status, a score, and actionable feedback.
@@ -335,7 +385,7 @@ def check_quality(state: SectionState):
         ),
     ]
 
-    result = structured_llm.invoke(prompt)
+    result = await ainvoke(structured_llm, prompt)
     print(
         f"[check_quality] '{state['heading']}': "
         f"passed={result.passed}, score={result.score}"
@@ -353,7 +403,7 @@ def quality_router(state: SectionState) -> str:
     return "fail"
 
 
-def followup_research(state: SectionState):
+async def followup_research(state: SectionState, config: RunnableConfig):
     """
     Generate follow-up search queries from quality feedback,
     execute web searches via Tavily, and collect results.
@@ -376,26 +426,32 @@ def followup_research(state: SectionState):
         ),
     ]
 
-    result = structured_llm.invoke(prompt)
+    result = await ainvoke(structured_llm, prompt)
 
-    # Execute web searches for each follow-up query
+    # These results only feed this section's rewrite and are never stored as sources, so
+    # only near-duplicates within the batch are skipped: not the thread's query history,
+    # nor what other sections search. Responses come back in query order
+    candidates = [q.query for q in result.question]
+    threshold = Configration.from_runnable_config(config).query_similarity
+    queries = [candidates[position] for position in dedupe_queries(candidates, (), threshold)]
+    responses = await asearch_many(queries)
     search_results = []
-    for q in result.question:
-        try:
-            search_result = tavily_search.invoke(q.query)
-            search_results.append(f"Query: {q.query}\nResults: {search_result}")
-        except Exception as e:
-            search_results.append(f"Query: {q.query}\nError: {str(e)}")
+    for query, response in zip(queries, responses):
+        if "error" in response:
+            search_results.append(f"Query: {query}\nError: {response['error']}")
+        else:
+            search_results.append(f"Query: {query}\nResults: {json.dumps(response)}")
 
     combined = "\n\n---\n\n".join(search_results)
     print(
-        f"[followup_research] Completed {len(result.question)} searches "
+        f"[followup_research] Completed {len(queries)} of {len(result.question)} searches "
         f"for '{state['heading']}'"
     )
-    return {"follow_up_context": combined}
+    # Nothing to search: keep the quality feedback as rewrite context
+    return {"follow_up_context": combined or state.get("follow_up_context", "")}
 
 
-def rewrite_section(state: SectionState):
+async def rewrite_section(state: SectionState):
     """
     Rewrite the section incorporating new research findings
     and addressing quality issues.
@@ -410,7 +466,7 @@ def rewrite_section(state: SectionState):
                 f"## Section Title: {state['heading']}\n\n"
                 f"## Previous Draft:\n{state['section_content']}\n\n"
                 f"## Original Research Context:\n"
-                f"Sources: {state['sources']}\n"
+                f"Sources: {state.get('passages') or state['sources']}\n"
                 f"Notes: {state['notes']}\n"
                 f"Draft: {state['draft']}\n\n"
                 f"## Additional Research Findings:\n{state['follow_up_context']}\n\n"
@@ -421,7 +477,7 @@ def rewrite_section(state: SectionState):
         ),
     ]
 
-    response = llm.invoke(prompt)
+    response = await ainvoke(llm, prompt)
     print(f"[rewrite_section] Rewrote section: {state['heading']}")
     return {"section_content": response.content}
 
@@ -459,40 +515,49 @@ section_builder.add_edge("followup_research", "rewrite_section")
 section_builder.add_edge("rewrite_section", "finalize_section")
 section_builder.add_edge("finalize_section", END)
 
-section_pipeline = section_builder.compile()
+# checkpointer=False: when run from the research graph, never inherit its sync SqliteSaver
+section_pipeline = section_builder.compile(checkpointer=False)
 
 
-def run_section_pipeline(state: SectionState):
+async def run_section_pipeline(state: SectionState):
     """Wrapper that invokes the section subgraph and returns only 'sections'.
 
     This prevents parallel subgraphs from writing non-annotated keys
     (sources, notes, draft, etc.) back to the parent State concurrently.
     """
-    result = section_pipeline.invoke(dict(state))
+    result = await section_pipeline.ainvoke(dict(state))
     return {"sections": result.get("sections", [])}
 
 
 
 g = StateGraph(State)
-g.add_node("read_sources", read_sources)
+# Sources, notes and draft are summarized concurrently; headings wait for all three
+g.add_node("summarize_sources", summarize_sources)
+g.add_node("summarize_notes", summarize_notes)
+g.add_node("summarize_draft", summarize_draft)
 g.add_node("heading_generator", heading_generator)
 g.add_node("section_pipeline", run_section_pipeline)
 g.add_node("collect_sections", collect_sections)
 
-g.add_edge(START, "read_sources")
-g.add_edge("read_sources", "heading_generator")
+for summary_node in ("summarize_sources", "summarize_notes", "summarize_draft"):
+    g.add_edge(START, summary_node)
+g.add_edge(["summarize_sources", "summarize_notes", "summarize_draft"], "heading_generator")
 g.add_conditional_edges("heading_generator", process_topic, ["section_pipeline"])
 g.add_edge("section_pipeline", "collect_sections")
 g.add_edge("collect_sections", END)
 
-app = g.compile()
+app = g.compile(checkpointer=False)
 
 
-def run_writer_agent(tid: str = "hsi") -> str:
-    """Public entry point: run the writer pipeline and return the final report.
+async def arun_writer_agent(tid: str = "hsi", config: RunnableConfig | None = None) -> str:
+    """Async entry point: run the writer pipeline and return the final report.
+
+    Section pipelines run concurrently on one event loop; in-flight LLM requests are
+    bounded by ``llm_concurrency``.
 
     Args:
         tid: thread id used to locate research files.
+        config: Run config whose ``configurable`` values the writer nodes read.
 
     Returns:
         The formatted final report string.
@@ -500,11 +565,25 @@ def run_writer_agent(tid: str = "hsi") -> str:
     global thread_id
     thread_id = tid
 
-    result = app.invoke({"requirements": ""})
+    result = await app.ainvoke({"requirements": ""}, config=config)
     return result.get("final_report", "No report generated")
 
 
+def run_writer_agent(tid: str = "hsi", config: RunnableConfig | None = None) -> str:
+    """Public entry point: run the writer pipeline and return the final report.
+
+    Args:
+        tid: thread id used to locate research files.
+        config: Run config whose ``configurable`` values the writer nodes read.
+
+    Returns:
+        The formatted final report string.
+    """
+    return asyncio.run(arun_writer_agent(tid, config))
+
+
 if __name__ == "__main__":
+    warm_up()
     report = run_writer_agent()
     print("\n\n========== FINAL REPORT ==========\n")
     print(report)